@@ -0,0 +1,129 @@
+import json
+import numpy as np
+import pandas as pd
+import Cache_Biblio as cache
+import Lexico_Biblio as lx
+import Paralelo_Biblio as pl
+import Metricas_Biblio as mt
+import Sentimiento_Biblio as sentimiento
+
+# Autores que se conservan por categoría. Los que quedan fuera se resumen en una cota: ninguno
+# tiene más comentarios que el umbral de su categoría.
+CAPACIDAD = 2_000
+MEZCLAS = {'narrativa': ['PRO', 'NEUTRO', 'ANTI'], 'sentimiento': ['Positivo', 'Neutral', 'Negativo']}
+COLUMNAS_MEZCLA = [f'{columna}_{valor}' for columna, valores in MEZCLAS.items() for valor in valores]
+TODAS = 'Todas'
+# La narrativa sale de la columna de la tabla; el sentimiento, del modelo de Sentimiento_Biblio.
+LEXICOS = lx.NARRATIVA
+
+
+def _truncar(tabla, totales, capacidad):
+    tabla = tabla.sort_values(['categoria', 'comentarios'], ascending=[True, False], kind='stable')
+    posicion = tabla.groupby('categoria', observed=True).cumcount().to_numpy()
+    desbordados = tabla[posicion == capacidad].set_index('categoria')['comentarios']
+    desbordados.index = desbordados.index.astype(str)
+    umbrales = pd.concat([totales, desbordados], axis=1).fillna(0).max(axis=1).astype(np.int64)
+    return {'autores': tabla[posicion < capacidad].reset_index(drop=True), 'umbrales': umbrales}
+
+
+def _resumen(df, capacidad=CAPACIDAD):
+    # Resumen exacto de un fragmento: comentarios y mezcla de narrativas y sentimientos por autor.
+    medidas = pd.DataFrame({'comentarios': np.ones(len(df), dtype=np.int64)}, index=df.index)
+    for columna, valores in MEZCLAS.items():
+        for valor in valores:
+            medidas[f'{columna}_{valor}'] = (df[columna] == valor).to_numpy().astype(np.int64)
+    con_dia = (df['dia'] != cache.SIN_DIA).to_numpy()
+    medidas['primer_dia'] = np.where(con_dia, df['dia'], np.iinfo(np.int32).max).astype(np.int32)
+    medidas['ultimo_dia'] = np.where(con_dia, df['dia'], cache.SIN_DIA).astype(np.int32)
+
+    agregados = {'comentarios': 'sum', **{c: 'sum' for c in COLUMNAS_MEZCLA}, 'primer_dia': 'min', 'ultimo_dia': 'max'}
+    tabla = medidas.groupby([df['categoria'], df['usuario']], observed=True).agg(agregados).reset_index()
+    tabla.insert(3, 'error', np.zeros(len(tabla), dtype=np.int64))
+    totales = pd.Series(0, index=tabla['categoria'].astype(str).unique(), dtype=np.int64)
+    return _truncar(tabla, totales, capacidad)
+
+
+def fusionar(resumenes, capacidad=CAPACIDAD):
+    # Unión de resúmenes Space-Saving: a un autor ausente de una parte se le suma el umbral de esa
+    # parte, como cota de lo que pudo tener allí. El recuento real está en [comentarios - error, comentarios].
+    partes = [
+        r['autores'].assign(cota=r['autores']['categoria'].astype(str).map(r['umbrales']).fillna(0).astype(np.int64))
+        for r in resumenes
+    ]
+    totales = pd.concat([r['umbrales'] for r in resumenes], axis=1).fillna(0).sum(axis=1).astype(np.int64)
+
+    agregados = {'comentarios': 'sum', 'error': 'sum', 'cota': 'sum', **{c: 'sum' for c in COLUMNAS_MEZCLA},
+                 'primer_dia': 'min', 'ultimo_dia': 'max'}
+    tabla = cache.concatenar(partes).groupby(['categoria', 'usuario'], observed=True).agg(agregados).reset_index()
+    correccion = tabla['categoria'].astype(str).map(totales).fillna(0).to_numpy(np.int64) - tabla.pop('cota')
+    tabla['comentarios'] += correccion
+    tabla['error'] += correccion
+    return _truncar(tabla, totales, capacidad)
+
+
+def _unir(resumenes, capacidad=CAPACIDAD):
+    # Fragmentos con autores disjuntos: cada resumen ya es exacto y basta con juntarlos y truncar una
+    # vez. Ordenados como los agrupa un solo proceso, los empates se resuelven igual.
+    tabla = cache.concatenar([r['autores'] for r in resumenes])
+    tabla = tabla.sort_values(['categoria', 'usuario'], kind='stable').reset_index(drop=True)
+    totales = pd.concat([r['umbrales'] for r in resumenes], axis=1).fillna(0).max(axis=1).astype(np.int64)
+    return _truncar(tabla, totales, capacidad)
+
+
+@mt.instrumentar
+def construir_autores(df, procesos=None, modelo=None):
+    # Cada autor cae en un solo fragmento, así que los resúmenes parciales son exactos y el resultado
+    # no depende del número de procesos. El sentimiento se puntúa antes de repartir, con su almacén.
+    categorias = sentimiento.categorizar(sentimiento.polaridades(df['contenido_comentario'], procesos, modelo=modelo))
+    columnas = df[['categoria', 'usuario', 'dia', 'narrativa']].assign(sentimiento=categorias.to_numpy())
+    return pl.agregar(_resumen, _unir, columnas, procesos, clave='usuario')
+
+
+@mt.instrumentar
+def combinar(autores, nuevos, modelo=None):
+    # Los autores de un anexo pueden estar ya en el resumen: aquí sí se funden con las cotas.
+    return fusionar([autores, construir_autores(nuevos, modelo=modelo)])
+
+
+def _todas(autores, capacidad=CAPACIDAD):
+    # Las categorías se funden como partes de un mismo resumen.
+    partes = []
+    for categoria, umbral in autores['umbrales'].items():
+        tabla = autores['autores'][(autores['autores']['categoria'] == categoria).to_numpy()]
+        tabla = tabla.assign(categoria=TODAS, usuario=tabla['usuario'].astype(str))
+        partes.append({'autores': tabla, 'umbrales': pd.Series({TODAS: umbral}, dtype=np.int64)})
+    return fusionar(partes, capacidad) if partes else autores
+
+
+def mas_activos(autores, categoria=None, top_n=10):
+    # Autores con más comentarios y su mezcla de narrativas y sentimientos, en porcentaje.
+    if categoria is None:
+        autores = _todas(autores)
+        categoria = TODAS
+    tabla = autores['autores'][(autores['autores']['categoria'].astype(str) == categoria).to_numpy()].head(top_n)
+    resultado = pd.DataFrame({
+        'usuario': tabla['usuario'].astype(str).to_numpy(),
+        'comentarios': tabla['comentarios'].to_numpy(),
+        'minimo': (tabla['comentarios'] - tabla['error']).to_numpy(),
+        'primer_comentario': pd.to_datetime(tabla['primer_dia'].where(tabla['primer_dia'] != np.iinfo(np.int32).max)
+                                            .to_numpy(), unit='D'),
+        'ultimo_comentario': pd.to_datetime(tabla['ultimo_dia'].where(tabla['ultimo_dia'] != cache.SIN_DIA)
+                                            .to_numpy(), unit='D'),
+    })
+    for columna, valores in MEZCLAS.items():
+        contados = tabla[[f'{columna}_{v}' for v in valores]].sum(axis=1).replace(0, np.nan)
+        for valor in valores:
+            resultado[f'% {valor}'] = (100 * tabla[f'{columna}_{valor}'] / contados).round(1).to_numpy()
+    return resultado
+
+
+def guardar_autores(autores, destino):
+    autores['autores'].to_parquet(destino + '.autores.parquet', index=False)
+    with open(destino + '.umbrales.json', 'w', encoding='utf-8') as archivo:
+        json.dump({k: int(v) for k, v in autores['umbrales'].items()}, archivo)
+
+
+def leer_autores(destino):
+    with open(destino + '.umbrales.json', 'r', encoding='utf-8') as archivo:
+        umbrales = pd.Series(json.load(archivo), dtype=np.int64)
+    return {'autores': pd.read_parquet(destino + '.autores.parquet'), 'umbrales': umbrales}
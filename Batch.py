@@ -0,0 +1,299 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+import Autores_Biblio as au
+import Cache_Biblio as cache
+import Carga_Biblio as cl
+import Cubo_Biblio as cb
+import Duplicados_Biblio as dp
+import Frecuencias_Biblio as fr
+import Indice_Biblio as ix
+import Lexico_Biblio as lx
+import Picos_Biblio as pk
+import Sentimiento_Biblio as sentimiento
+import Story_Biblio as sb
+import Temas_Biblio as tm
+
+PALABRAS_CLAVE = ['cuba', 'gobierno', 'economía']
+TOP_REPETIDOS = 50
+TOP_PALABRAS = 100
+TOP_AUTORES = 100
+
+_tablas = {}
+_opciones = {}
+_artefactos = {}
+
+
+def _inicializar(tablas, opciones, artefactos=None):
+    _tablas.update(tablas)
+    _opciones.update(opciones)
+    _artefactos.update(artefactos or {})
+
+
+def _compartido(clave, cargar):
+    if clave not in _artefactos:
+        _artefactos[clave] = cargar()
+    return _artefactos[clave]
+
+
+def _indice_texto(tabla='comentarios'):
+    # La tabla de la historia se reordena al añadir anexos, así que su índice se reconstruye entero.
+    df = _tablas[tabla]
+    opciones = sb.OPCIONES_HISTORIA if tabla == 'historia' else {}
+    return _compartido(f'indice_texto:{tabla}', lambda: cache.cargar_artefacto(
+        'indice_texto', lambda: ix.construir_indice(df), ix.leer_indice, ix.guardar_indice,
+        _opciones['ruta'], combinar=None if opciones else ix.combinar, **opciones
+    ))
+
+
+def _polaridades(procesos=None):
+    return sentimiento.polaridades(_tablas['comentarios']['contenido_comentario'], procesos, modelo=_opciones['modelo'])
+
+
+def _sentimiento():
+    df = _tablas['comentarios']
+    categorias = sentimiento.categorizar(_polaridades(procesos=1))
+    conteo = pd.DataFrame({'categoria': df['categoria'], 'sentimiento': categorias})
+    return {'sentimiento': conteo.groupby(['categoria', 'sentimiento'], observed=True).size()
+            .reset_index(name='comentarios')}
+
+
+def _narrativa():
+    historia = _tablas['historia']
+    narrativas = historia['narrativa'].value_counts().rename_axis('narrativa').reset_index(name='comentarios')
+    emociones = historia['emocion']
+    if _opciones['modelo_emociones']:
+        emociones = sentimiento.emociones(historia['contenido_comentario'], _opciones['modelo_emociones'], procesos=1)
+    emociones = emociones.value_counts().rename_axis('emocion').reset_index(name='comentarios')
+    for tabla in (narrativas, emociones):
+        tabla['porcentaje'] = (tabla['comentarios'] / max(len(historia), 1) * 100).round(2)
+    return {'narrativas': narrativas, 'emociones_historia': emociones}
+
+
+def _consignas():
+    consignas, _ = sb.analizar_consignas_cubanas(_tablas['historia'], _indice_texto('historia'))
+    return {'consignas': consignas}
+
+
+def _emociones():
+    df = _tablas['comentarios']
+    presencia = lx.contar(df['contenido_comentario'], 'emociones_basicas') > 0
+    return {'emociones': presencia.groupby(df['categoria'], observed=True).sum().reset_index()}
+
+
+def _violencia():
+    df = _tablas['comentarios']
+    indice = _indice_texto()
+    apariciones = np.concatenate([ix.ocurrencias(indice, t) for t in lx.LEXICOS['violencia']])
+    violencia = pd.Series(np.bincount(apariciones, minlength=len(df)), index=df.index)
+    return {'violencia': violencia.groupby(df['categoria'], observed=True).sum().reset_index(name='violencia')}
+
+
+def _duplicados():
+    df = _tablas['comentarios']
+    conteo = df['contenido_comentario'].str.lower().value_counts()
+    repetidos = conteo[conteo > 1].head(TOP_REPETIDOS).rename_axis('comentario').reset_index(name='repeticiones')
+
+    indice = cache.cargar_artefacto(
+        'casi_duplicados', lambda: dp.construir_indice(df), dp.leer_indice, dp.guardar_indice,
+        _opciones['ruta'], combinar=dp.actualizar_indice
+    )
+    grupos = dp.grupos_similares(indice)
+    grupos['usuarios'] = grupos['usuarios'].map(json.dumps)
+    return {'repetidos': repetidos, 'casi_duplicados': grupos}
+
+
+def _frecuencias():
+    df = _tablas['comentarios']
+    tabla = cache.cargar_artefacto(
+        'frecuencias', lambda: fr.tabla_frecuencias(df), fr.leer_frecuencias, fr.guardar_frecuencias,
+        _opciones['ruta'], combinar=fr.combinar
+    )
+    categorias = tabla.groupby(['categoria', 'termino'], observed=True)['frecuencia'].sum().reset_index()
+    categorias = categorias.sort_values('frecuencia', ascending=False, kind='stable')
+    return {'palabras_frecuentes': categorias.groupby('categoria', observed=True).head(TOP_PALABRAS)}
+
+
+def _detector():
+    return _compartido('picos', lambda: cache.cargar_artefacto(
+        'picos', lambda: pk.construir_detector(_tablas['historia']), pk.leer_detector, pk.guardar_detector,
+        _opciones['ruta'], combinar=pk.combinar, **sb.OPCIONES_HISTORIA
+    ))
+
+
+def _picos():
+    detector = _detector()
+    picos = pk.picos(detector)
+    return {
+        'actividad_temporal': sb.analisis_temporal(_tablas['historia'], detector),
+        'picos_noticias': pk.noticias_pico(detector, picos['fecha']),
+    }
+
+
+def _historia():
+    # Deja listo el resumen que lee Story.py; sus tablas ya las escriben los demás análisis.
+    df = _tablas['historia']
+    cache.cargar_artefacto(
+        'historia', lambda: sb.resumen_historia(df, _indice_texto('historia'), _detector()),
+        sb.leer_historia, sb.guardar_historia, _opciones['ruta'], lexicos=sb.LEXICOS_HISTORIA,
+        **sb.OPCIONES_HISTORIA
+    )
+    return {}
+
+
+def _palabras_clave():
+    indice = _indice_texto()
+    evolucion = pd.DataFrame({p: ix.dias_con(indice, p) for p in _opciones['palabras']}, columns=_opciones['palabras'])
+    return {'palabras_clave': evolucion.fillna(0).astype(int).rename_axis('fecha').reset_index()}
+
+
+def _autores():
+    df = _tablas['comentarios']
+    modelo = _opciones['modelo']
+    autores = cache.cargar_artefacto(
+        'autores', lambda: au.construir_autores(df, modelo=modelo), au.leer_autores, au.guardar_autores,
+        _opciones['ruta'], combinar=partial(au.combinar, modelo=modelo), lexicos=au.LEXICOS,
+        modelo=sentimiento.version(modelo)
+    )
+    return {'autores_activos': au.mas_activos(autores, top_n=TOP_AUTORES)}
+
+
+def _temas():
+    df = _tablas['comentarios']
+    try:
+        temas = cache.cargar_artefacto(
+            'temas', lambda: tm.construir_temas(df), tm.leer_temas, tm.guardar_temas,
+            _opciones['ruta'], combinar=tm.combinar
+        )
+    except ImportError:
+        # scikit-learn es opcional: sin él no hay temas, pero el resto de análisis sigue.
+        return {}
+    por_categoria = pd.crosstab(df['categoria'], temas['temas']).stack().rename('comentarios')
+    por_categoria = por_categoria.rename_axis(['categoria', 'tema']).reset_index()
+    return {'temas': tm.describir(temas), 'temas_por_categoria': por_categoria[por_categoria['tema'] != tm.SIN_TEMA]}
+
+
+def _cubo():
+    df = _tablas['comentarios']
+    cubo = cache.cargar_artefacto(
+        'cubo', lambda: cb.construir_cubo(df), cb.leer_cubo, cb.guardar_cubo,
+        _opciones['ruta'], combinar=cb.combinar, lexicos=cb.LEXICOS
+    )
+    return {'cubo': cubo['celdas']}
+
+
+ANALISIS = {
+    'sentimiento': _sentimiento,
+    'narrativa': _narrativa,
+    'consignas': _consignas,
+    'emociones': _emociones,
+    'violencia': _violencia,
+    'duplicados': _duplicados,
+    'frecuencias': _frecuencias,
+    'picos': _picos,
+    'historia': _historia,
+    'palabras_clave': _palabras_clave,
+    'autores': _autores,
+    'temas': _temas,
+    'cubo': _cubo,
+}
+
+# Artefactos que usan varios análisis. Se preparan antes de repartir, así dos procesos no construyen
+# el mismo a la vez con la caché vacía; con fork los heredan ya cargados.
+COMPARTIDOS = [
+    (('violencia', 'palabras_clave'), _indice_texto),
+    (('consignas', 'historia'), lambda: _indice_texto('historia')),
+    (('picos', 'historia'), _detector),
+    # Las puntuaciones quedan guardadas por texto; con fork, los procesos las heredan ya en memoria.
+    (('sentimiento', 'autores'), _polaridades),
+]
+
+
+def _ejecutar(nombre):
+    inicio = time.perf_counter()
+    resultados = ANALISIS[nombre]()
+    return nombre, resultados, time.perf_counter() - inicio
+
+
+def _escribir(tabla, destino, formato):
+    if formato == 'parquet':
+        tabla.to_parquet(destino + '.parquet', index=False)
+    else:
+        tabla.to_json(destino + '.json', orient='records', force_ascii=False, date_format='iso')
+
+
+def ejecutar(ruta=cl.RUTA_DATOS, salida='resultados', procesos=None, analisis=None,
+             palabras=None, formato='parquet', modelo=None, modelo_emociones=None):
+    inicio = time.perf_counter()
+    tablas = {
+        'comentarios': cache.cargar_tabla(ruta),
+        'historia': cache.cargar_tabla(ruta, **sb.OPCIONES_HISTORIA),
+    }
+    opciones = {'ruta': ruta, 'palabras': palabras or PALABRAS_CLAVE, 'modelo': modelo,
+                'modelo_emociones': modelo_emociones}
+    tiempos = {'carga': time.perf_counter() - inicio}
+
+    analisis = analisis or list(ANALISIS)
+    _inicializar(tablas, opciones)
+    inicio_compartidos = time.perf_counter()
+    for usuarios, preparar in COMPARTIDOS:
+        if len(set(usuarios) & set(analisis)) > 1:
+            preparar()
+    tiempos['compartidos'] = time.perf_counter() - inicio_compartidos
+
+    # Con fork los procesos heredan las tablas ya cargadas en lugar de recibirlas serializadas.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        pool = ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context('fork'))
+    else:
+        pool = ProcessPoolExecutor(procesos, initializer=_inicializar, initargs=(tablas, opciones, _artefactos))
+
+    os.makedirs(salida, exist_ok=True)
+    with pool:
+        for nombre, resultados, duracion in pool.map(_ejecutar, analisis):
+            tiempos[nombre] = duracion
+            for tabla, datos in resultados.items():
+                _escribir(datos, os.path.join(salida, tabla), formato)
+
+    resumen = {
+        'fuente': os.path.abspath(ruta),
+        'comentarios': len(tablas['comentarios']),
+        'comentarios_historia': len(tablas['historia']),
+        'fechas': cache.resumen_fechas(tablas['comentarios']),
+        'segundos': {k: round(v, 3) for k, v in tiempos.items()},
+        'total_segundos': round(time.perf_counter() - inicio, 3),
+    }
+    with open(os.path.join(salida, 'resumen.json'), 'w', encoding='utf-8') as archivo:
+        json.dump(resumen, archivo, ensure_ascii=False, indent=2)
+    return resumen
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Ejecuta todos los análisis de EcoCubano sin Streamlit.")
+    parser.add_argument('--datos', default=cl.RUTA_DATOS, help="Exportación JSON de comentarios")
+    parser.add_argument('--salida', default='resultados', help="Carpeta donde se escriben las tablas")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos en paralelo (por defecto, todos los núcleos)")
+    parser.add_argument('--analisis', nargs='+', choices=list(ANALISIS), help="Ejecutar solo estos análisis")
+    parser.add_argument('--palabras', default=','.join(PALABRAS_CLAVE), help="Palabras clave separadas por comas")
+    parser.add_argument('--formato', choices=['parquet', 'json'], default='parquet')
+    parser.add_argument('--modelo', default=None,
+                        help="Modelo de sentimiento: textblob, lexico, sklearn:<ruta> u onnx:<ruta>")
+    parser.add_argument('--modelo-emociones', default=None,
+                        help="Modelo para las emociones de la historia (por defecto, el léxico guardado en la tabla)")
+    args = parser.parse_args(argumentos)
+
+    resumen = ejecutar(
+        args.datos, args.salida, args.procesos, args.analisis,
+        [p.strip().lower() for p in args.palabras.split(',') if p.strip()], args.formato,
+        args.modelo, args.modelo_emociones
+    )
+    print(json.dumps(resumen, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import Autores_Biblio as autores
+import Batch
+import Cache_Biblio as cache
+import Carga_Biblio as cl
+import Cubo_Biblio as cb
+import Data_Biblio as dp
+import Duplicados_Biblio as duplicados
+import Frecuencias_Biblio as fr
+import Indice_Biblio as ix
+import Lexico_Biblio as lx
+import Metricas_Biblio as mt
+import Sentimiento_Biblio as sentimiento
+import Sintetico_Biblio as sintetico
+import Story_Biblio as sb
+import Temas_Biblio as temas
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+TAMANOS = [10_000, 100_000]
+RESULTADOS = 'benchmarks.jsonl'
+# Solo los corpus sintéticos se conservan entre ejecuciones; las cachés se crean vacías en cada medición.
+DIRECTORIO_CORPUS = os.path.join(tempfile.gettempdir(), 'ecocubano_benchmark')
+
+_datos = {}
+
+MEDICIONES = {
+    'carga_json': lambda d: cl.cargar_comentarios(d['ruta']),
+    'carga_json_politica': lambda d: cl.cargar_comentarios(d['ruta'], ['politica']),
+    'normalizar': lambda d: cache.normalizar(cl.cargar_comentarios(d['ruta'])),
+    'cargar_tabla': lambda d: cache.cargar_tabla(d['ruta']),
+    'sentimiento': lambda d: dp.analizar_sentimiento(d['comentarios']),
+    'nube_palabras': lambda d: dp.generar_nube_palabras(fr.contar_palabras(d['comentarios']['contenido_comentario'])),
+    'frecuencias': lambda d: fr.tabla_frecuencias(d['comentarios']),
+    'palabras_clave': lambda d: dp.evolucion_palabras_clave(d['comentarios'], Batch.PALABRAS_CLAVE),
+    'violencia': lambda d: dp.analizar_violencia(d['comentarios']),
+    'indice_texto': lambda d: ix.construir_indice(d['comentarios']),
+    'buscar_indice': lambda d: [ix.buscar(d['indice'], p) for p in Batch.PALABRAS_CLAVE + ['patria o muerte']],
+    'repetidos': lambda d: dp.identificar_comentarios_repetidos(d['comentarios']),
+    'narrativas': lambda d: sb.clasificar_narrativas(d['comentarios']['contenido_comentario']),
+    'emociones': lambda d: sb.analizar_emociones_textos(d['comentarios']['contenido_comentario']),
+    'consignas': lambda d: sb.analizar_consignas_cubanas(d['historia']),
+    'picos': lambda d: sb.picos_comentarios_por_fecha(d['historia']),
+    'temporal': lambda d: sb.analisis_temporal(d['historia']),
+    'cubo': lambda d: cb.construir_cubo(d['comentarios']),
+    'autores': lambda d: autores.construir_autores(d['comentarios']),
+    'casi_duplicados': lambda d: duplicados.construir_indice(d['comentarios']),
+}
+# scikit-learn es opcional: sin él los temas no se miden.
+if importlib.util.find_spec('sklearn') is not None:
+    MEDICIONES['temas'] = lambda d: temas.construir_temas(d['comentarios'])
+
+
+def _reiniciar_pico():
+    # En Linux, escribir 5 en clear_refs reinicia VmHWM al RSS actual del proceso.
+    try:
+        with open('/proc/self/clear_refs', 'w') as archivo:
+            archivo.write('5')
+    except OSError:
+        pass
+
+
+def _rss_pico():
+    try:
+        with open('/proc/self/status') as archivo:
+            for linea in archivo:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == 'darwin' else pico * 1024
+
+
+def _cache_vacia(directorio):
+    # Ni tablas, ni conteos de léxicos, ni puntuaciones de sentimiento de mediciones anteriores: con
+    # ellos una medición repetida saldría más rápida sin que el código lo sea.
+    cache.DIRECTORIO_CACHE = directorio
+    sentimiento.DIRECTORIO_PUNTUACIONES = os.path.join(directorio, 'sentimiento')
+    sentimiento._puntuaciones.clear()
+    lx._conteos.clear()
+
+
+def _medir(nombre):
+    with tempfile.TemporaryDirectory(prefix='ecocubano_benchmark_') as directorio:
+        _cache_vacia(directorio)
+        _reiniciar_pico()
+        inicial = mt.rss_actual()
+        inicio = time.perf_counter()
+        MEDICIONES[nombre](_datos)
+        segundos = time.perf_counter() - inicio
+        pico = _rss_pico()
+    return {
+        'segundos': round(segundos, 4),
+        'rss_pico_mb': round(pico / 2**20, 1) if pico else None,
+        'rss_incremento_mb': round((pico - inicial) / 2**20, 1) if pico and inicial else None,
+    }
+
+
+def _medir_aislado(nombre):
+    # Cada medición corre en un proceso nuevo que hereda las tablas, así los picos no se acumulan.
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return _medir(nombre)
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('fork')) as pool:
+        return pool.submit(_medir, nombre).result()
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def preparar_corpus(comentarios, semilla=0):
+    ruta = os.path.join(DIRECTORIO_CORPUS, f'corpus-{comentarios}-{semilla}.json')
+    if not os.path.exists(ruta):
+        os.makedirs(DIRECTORIO_CORPUS, exist_ok=True)
+        sintetico.generar_exportacion(ruta + '.tmp', comentarios, semilla)
+        os.replace(ruta + '.tmp', ruta)
+    return ruta
+
+
+def medir(tamanos=None, mediciones=None, repeticiones=1, semilla=0):
+    comun = {'fecha': pd.Timestamp.now().isoformat(timespec='seconds'), 'commit': _commit(),
+             'python': platform.python_version(), 'pandas': pd.__version__}
+    registros = []
+    for comentarios in tamanos or TAMANOS:
+        ruta = preparar_corpus(comentarios, semilla)
+        _datos.clear()
+        with tempfile.TemporaryDirectory(prefix='ecocubano_benchmark_') as directorio:
+            _cache_vacia(directorio)
+            _datos.update({
+                'ruta': ruta,
+                'comentarios': cache.cargar_tabla(ruta),
+                'historia': cache.cargar_tabla(ruta, **sb.OPCIONES_HISTORIA),
+            })
+        _datos['indice'] = ix.construir_indice(_datos['comentarios'])
+        for nombre in mediciones or list(MEDICIONES):
+            for repeticion in range(repeticiones):
+                registro = {**comun, 'comentarios': comentarios, 'medicion': nombre, 'repeticion': repeticion,
+                            **_medir_aislado(nombre)}
+                registros.append(registro)
+                print(f"{comentarios:>10} {nombre:<22} {registro['segundos']:>9.3f} s "
+                      f"{registro['rss_pico_mb'] or float('nan'):>9.1f} MB", flush=True)
+    return registros
+
+
+def leer_resultados(ruta=RESULTADOS):
+    if not os.path.exists(ruta):
+        return pd.DataFrame()
+    return pd.read_json(ruta, lines=True)
+
+
+def guardar_resultados(registros, ruta=RESULTADOS):
+    with open(ruta, 'a', encoding='utf-8') as archivo:
+        for registro in registros:
+            archivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+
+
+def comparar(actuales, anteriores):
+    # Mediana de cada medición frente a la última ejecución anterior con el mismo tamaño.
+    claves = ['comentarios', 'medicion']
+    actuales = pd.DataFrame(actuales).groupby(claves)[['segundos', 'rss_pico_mb']].median()
+    if anteriores.empty:
+        return actuales
+    ultima = anteriores[anteriores['fecha'] == anteriores.groupby(claves)['fecha'].transform('max')]
+    ultima = ultima.groupby(claves)[['segundos', 'rss_pico_mb']].median()
+    tabla = actuales.join(ultima, rsuffix='_anterior')
+    tabla['cambio_tiempo'] = (tabla['segundos'] / tabla['segundos_anterior']).round(2)
+    tabla['cambio_memoria'] = (tabla['rss_pico_mb'] / tabla['rss_pico_mb_anterior']).round(2)
+    return tabla
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Mide tiempo y memoria de la carga y los análisis sobre datos sintéticos.")
+    parser.add_argument('--tamanos', type=int, nargs='+', default=TAMANOS, help="Comentarios por corpus")
+    parser.add_argument('--mediciones', nargs='+', choices=list(MEDICIONES), help="Medir solo estas funciones")
+    parser.add_argument('--repeticiones', type=int, default=1)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--resultados', default=RESULTADOS, help="Archivo JSONL donde se acumulan las ejecuciones")
+    args = parser.parse_args(argumentos)
+
+    anteriores = leer_resultados(args.resultados)
+    registros = medir(args.tamanos, args.mediciones, args.repeticiones, args.semilla)
+    guardar_resultados(registros, args.resultados)
+    with pd.option_context('display.width', 200, 'display.max_rows', None):
+        print(comparar(registros, anteriores))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import Carga_Biblio as cl
+import Story_Biblio as sb
+import Lexico_Biblio as lx
+import Metricas_Biblio as mt
+
+DIRECTORIO_CACHE = os.environ.get('ECOCUBANO_CACHE', '.cache_ecocubano')
+VERSION_CACHE = 5
+SIN_DIA = np.iinfo(np.int32).min
+# Formatos que se prueban cuando no se indica uno; ante un empate gana el primero.
+FORMATOS_FECHA = ['%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%d/%m/%Y', '%d/%m/%Y %H:%M',
+                  '%d-%m-%Y', '%d/%m/%y']
+SIN_FECHA = {'', 'sin fecha'}
+MUESTRA_FORMATO = 1000
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+COLUMNAS_CATEGORICAS = ['titulo_noticia', 'categoria', 'usuario', 'dia_semana', 'narrativa', 'emocion']
+# Léxicos de las columnas narrativa y emoción: si cambian, solo esas columnas se vuelven a calcular.
+LEXICOS_TABLA = lx.NARRATIVA + lx.EMOCION
+
+
+def hash_archivo(ruta, tamano_lectura=cl.TAMANO_LECTURA):
+    sha1 = hashlib.sha1()
+    with open(ruta, 'rb') as archivo:
+        for fragmento in iter(lambda: archivo.read(tamano_lectura), b''):
+            sha1.update(fragmento)
+    return sha1.hexdigest()
+
+
+def huella_archivo(ruta):
+    estado = os.stat(ruta)
+    return {'tamano': estado.st_size, 'mtime_ns': estado.st_mtime_ns}
+
+
+def dia_ordinal(fecha):
+    return (pd.Timestamp(fecha) - pd.Timestamp(0)).days
+
+
+def dias_ordinales(fechas):
+    # Días desde 1970-01-01 en int32; SIN_DIA marca las fechas que no se pudieron leer.
+    dias = fechas.to_numpy(dtype='datetime64[D]')
+    return np.where(np.isnat(dias), SIN_DIA, dias.astype(np.int64)).astype(np.int32)
+
+
+def dias_semana(dias):
+    # El 1970-01-01 (día 0) fue jueves; no depende del locale del sistema.
+    codigos = np.where(dias == SIN_DIA, -1, (dias.astype(np.int64) + 3) % 7)
+    return pd.Categorical.from_codes(codigos, categories=DIAS_SEMANA)
+
+
+def detectar_formato(valores, muestra=MUESTRA_FORMATO):
+    # El formato conocido que lee más valores de una muestra repartida; None si no lee ninguno.
+    if len(valores) > muestra:
+        valores = valores[np.linspace(0, len(valores) - 1, muestra).astype(np.int64)]
+    leidos = {f: pd.to_datetime(valores, format=f, errors='coerce').notna().sum() for f in FORMATOS_FECHA}
+    formato = max(FORMATOS_FECHA, key=leidos.get)
+    return formato if leidos[formato] else None
+
+
+def leer_fechas(fechas, formato=None):
+    # Cada texto distinto se interpreta una sola vez: en las exportaciones las fechas se repiten mucho.
+    # Devuelve las fechas y un resumen con el formato usado y cuántas faltaban o no se pudieron leer.
+    if pd.api.types.is_datetime64_any_dtype(fechas):
+        return fechas, {'formato': None, 'total': len(fechas), 'sin_fecha': int(fechas.isna().sum()),
+                        'invalidas': 0, 'descartadas': 0}
+
+    codigos, unicos = pd.factorize(fechas.astype(object).where(fechas.notna(), ''))
+    unicos = pd.Index(unicos, dtype=object).astype(str).str.strip()
+    presentes = ~np.asarray(unicos.str.lower().isin(SIN_FECHA), dtype=bool)
+
+    formato = formato or detectar_formato(unicos[presentes].to_numpy(dtype=object))
+    leidas = np.full(len(unicos), np.datetime64('NaT'), dtype='datetime64[ns]')
+    leidas[presentes] = pd.to_datetime(unicos[presentes], format=formato or 'mixed',
+                                       errors='coerce').to_numpy(dtype='datetime64[ns]')
+
+    resultado = pd.Series(leidas[codigos], index=fechas.index, name=fechas.name)
+    sin_fecha = int((~presentes)[codigos].sum())
+    return resultado, {
+        'formato': formato,
+        'total': len(fechas),
+        'sin_fecha': sin_fecha,
+        'invalidas': int(np.isnat(leidas[codigos]).sum()) - sin_fecha,
+        'descartadas': 0,
+    }
+
+
+def sumar_resumenes(resumenes):
+    resumenes = [r for r in resumenes if r]
+    if not resumenes:
+        return None
+    formatos = {r['formato'] for r in resumenes}
+    suma = {c: sum(r[c] for r in resumenes) for c in ('total', 'sin_fecha', 'invalidas', 'descartadas')}
+    return {'formato': formatos.pop() if len(formatos) == 1 else None, **suma}
+
+
+def claves_comentarios(df):
+    # Identidad de un comentario: noticia, autor, fecha y hash del contenido.
+    return pd.util.hash_pandas_object(
+        df[['titulo_noticia', 'usuario', 'fecha_comentario', 'contenido_comentario']], index=False
+    ).to_numpy()
+
+
+def _clasificar(df):
+    # Los léxicos se cuentan en paralelo y se guardan por comentario dentro de Lexico_Biblio.
+    df['narrativa'] = sb.clasificar_narrativas(df['contenido_comentario']).astype('category')
+    df['emocion'] = sb.analizar_emociones_textos(df['contenido_comentario']).astype('category')
+    return df
+
+
+@mt.instrumentar
+def normalizar(df, formato_fecha=None, descartar_sin_fecha=False):
+    # Única etapa que interpreta las fechas; los análisis usan fecha_comentario o el ordinal `dia`.
+    df['fecha_comentario'], resumen = leer_fechas(df['fecha_comentario'], formato_fecha)
+    if descartar_sin_fecha:
+        df = df.dropna(subset=['fecha_comentario']).sort_values('fecha_comentario', kind='stable')
+        df = df.reset_index(drop=True)
+        resumen['descartadas'] = resumen['total'] - len(df)
+    df['dia'] = dias_ordinales(df['fecha_comentario'])
+    df['dia_semana'] = dias_semana(df['dia'].to_numpy())
+    df['longitud'] = df['contenido_comentario'].str.len().astype(np.int32)
+    df = _clasificar(df)
+    df['clave'] = claves_comentarios(df)
+    for columna in COLUMNAS_CATEGORICAS:
+        df[columna] = df[columna].astype('category')
+    try:
+        df['contenido_comentario'] = df['contenido_comentario'].astype(pd.StringDtype('pyarrow'))
+    except ImportError:
+        pass
+    df.attrs['fechas'] = resumen
+    return df
+
+
+def resumen_fechas(df):
+    # Comentarios sin fecha, con fecha ilegible o descartados al cargar la tabla.
+    return df.attrs.get('fechas')
+
+
+def concatenar(tablas):
+    tablas = [t for t in tablas if len(t)] or tablas[:1]
+    if len(tablas) == 1:
+        return tablas[0]
+    categoricas = {
+        columna: union_categoricals([t[columna] for t in tablas], ignore_order=True).categories
+        for columna in tablas[0].columns if isinstance(tablas[0][columna].dtype, pd.CategoricalDtype)
+    }
+    tablas = [
+        t.assign(**{c: t[c].cat.set_categories(categorias) for c, categorias in categoricas.items()})
+        for t in tablas
+    ]
+    return pd.concat(tablas, ignore_index=True)
+
+
+def _ruta_cache(ruta, categorias=None, formato_fecha=None, descartar_sin_fecha=False):
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    clave = json.dumps([
+        os.path.abspath(ruta),
+        sorted(c.lower() for c in categorias) if categorias is not None else None,
+        formato_fecha,
+        descartar_sin_fecha,
+        VERSION_CACHE
+    ])
+    etiqueta = hashlib.sha1(clave.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(DIRECTORIO_CACHE, f'{nombre}-{etiqueta}')
+
+
+def _ruta_anexos(ruta):
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    etiqueta = hashlib.sha1(os.path.abspath(ruta).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(DIRECTORIO_CACHE, f'{nombre}-{etiqueta}-anexos')
+
+
+def _leer_meta(base):
+    try:
+        with open(base + '.json', 'r', encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _escribir_meta(base, meta):
+    temporal = base + '.json.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(meta, archivo)
+    os.replace(temporal, base + '.json')
+
+
+def _escribir_parquet(df, destino):
+    df.to_parquet(destino + '.tmp', index=False)
+    os.replace(destino + '.tmp', destino)
+
+
+def _leer_parte(destino, vigente):
+    # Una parte guardada con otros léxicos solo recalcula narrativa y emoción, y se reescribe.
+    df = pd.read_parquet(destino)
+    if vigente:
+        return df
+    df = _clasificar(df)
+    try:
+        _escribir_parquet(df, destino)
+    except OSError:
+        pass
+    return df
+
+
+def _vigente(base, ruta, huella):
+    meta = _leer_meta(base)
+    if meta is None or not os.path.exists(base + '.parquet'):
+        return None
+    if meta['tamano'] == huella['tamano'] and meta['mtime_ns'] == huella['mtime_ns']:
+        return meta
+    # Mismo contenido con otra fecha de modificación (p. ej. el archivo se volvió a subir).
+    if meta['tamano'] == huella['tamano'] and meta['sha1'] == hash_archivo(ruta):
+        meta = {**meta, **huella}
+        _escribir_meta(base, meta)
+        return meta
+    return None
+
+
+def registro_anexos(ruta=cl.RUTA_DATOS):
+    meta = _leer_meta(os.path.join(_ruta_anexos(ruta), 'registro'))
+    return meta['anexos'] if meta else []
+
+
+def registrar_anexo(contenido, ruta=cl.RUTA_DATOS):
+    # Guarda una exportación parcial; las tablas la incorporan la próxima vez que se cargan.
+    sha1 = hashlib.sha1(contenido).hexdigest()
+    anexos = registro_anexos(ruta)
+    if sha1 in anexos:
+        return False
+
+    directorio = _ruta_anexos(ruta)
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, f'{sha1}.json.tmp'), 'wb') as archivo:
+        archivo.write(contenido)
+    os.replace(os.path.join(directorio, f'{sha1}.json.tmp'), os.path.join(directorio, f'{sha1}.json'))
+    _escribir_meta(os.path.join(directorio, 'registro'), {'anexos': anexos + [sha1]})
+    return True
+
+
+def huella_fuente(ruta=cl.RUTA_DATOS):
+    return {**huella_archivo(ruta), 'anexos': registro_anexos(ruta)}
+
+
+def descartar_anexos(ruta=cl.RUTA_DATOS):
+    shutil.rmtree(_ruta_anexos(ruta), ignore_errors=True)
+
+
+def _incorporar_anexo(df, base, meta, sha1, ruta, categorias, formato_fecha, descartar_sin_fecha):
+    ruta_anexo = os.path.join(_ruta_anexos(ruta), f'{sha1}.json')
+    nuevos = normalizar(cl.cargar_comentarios(ruta_anexo, categorias), formato_fecha, descartar_sin_fecha)
+    nuevos = nuevos[~nuevos['clave'].duplicated()]
+    if len(df):
+        nuevos = nuevos[~nuevos['clave'].isin(df['clave'])]
+    nuevos = nuevos.reset_index(drop=True)
+
+    version = hashlib.sha1((meta['version'] + sha1).encode('utf-8')).hexdigest()
+    meta = {**meta, 'version': version, 'anexos': meta['anexos'] + [{'sha1': sha1, 'version': version}],
+            'fechas': sumar_resumenes([meta.get('fechas'), resumen_fechas(nuevos)])}
+    try:
+        os.makedirs(base + '.partes', exist_ok=True)
+        _escribir_parquet(nuevos, os.path.join(base + '.partes', f'{sha1}.parquet'))
+        _escribir_meta(base, meta)
+    except (ImportError, OSError):
+        pass
+    return concatenar([df, nuevos]), meta
+
+
+@mt.instrumentar
+def cargar_tabla(ruta=cl.RUTA_DATOS, categorias=None, formato_fecha=None, descartar_sin_fecha=False):
+    huella = huella_archivo(ruta)
+    base = _ruta_cache(ruta, categorias, formato_fecha, descartar_sin_fecha)
+    meta = _vigente(base, ruta, huella)
+    registro = registro_anexos(ruta)
+    if meta is not None and any(a['sha1'] not in registro for a in meta['anexos']):
+        meta = None
+    mt.anotar(cache='miss' if meta is None else 'hit')
+    df = None
+
+    lexicos = lx.version(*LEXICOS_TABLA)
+    if meta is not None:
+        try:
+            partes = [os.path.join(base + '.partes', f"{a['sha1']}.parquet") for a in meta['anexos']]
+            vigentes = meta.get('lexicos') == lexicos
+            df = concatenar([_leer_parte(p, vigentes) for p in [base + '.parquet'] + partes])
+            if not vigentes:
+                meta = {**meta, 'lexicos': lexicos}
+                _escribir_meta(base, meta)
+        except (ImportError, OSError):
+            df = None
+
+    if df is None:
+        df = normalizar(cl.cargar_comentarios(ruta, categorias), formato_fecha, descartar_sin_fecha)
+        sha1 = hash_archivo(ruta)
+        meta = {**huella, 'sha1': sha1, 'version': sha1, 'anexos': [], 'fechas': resumen_fechas(df),
+                'lexicos': lexicos}
+        try:
+            os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+            shutil.rmtree(base + '.partes', ignore_errors=True)
+            _escribir_parquet(df, base + '.parquet')
+            _escribir_meta(base, meta)
+        except (ImportError, OSError):
+            pass
+
+    incorporados = {a['sha1'] for a in meta['anexos']}
+    for sha1 in registro:
+        if sha1 not in incorporados:
+            mt.anotar(cache='parcial')
+            df, meta = _incorporar_anexo(df, base, meta, sha1, ruta, categorias, formato_fecha, descartar_sin_fecha)
+
+    if descartar_sin_fecha and meta['anexos']:
+        df = df.sort_values('fecha_comentario', kind='stable').reset_index(drop=True)
+    df.attrs['fechas'] = meta.get('fechas')
+    return df
+
+
+def tabla_vigente(ruta=cl.RUTA_DATOS, categorias=None, formato_fecha=None, descartar_sin_fecha=False):
+    # Si la tabla guardada corresponde al archivo y a todos sus anexos, sin leerla: los artefactos
+    # guardados con su versión siguen valiendo.
+    try:
+        meta = _vigente(_ruta_cache(ruta, categorias, formato_fecha, descartar_sin_fecha), ruta, huella_archivo(ruta))
+    except OSError:
+        return False
+    return meta is not None and {a['sha1'] for a in meta['anexos']} == set(registro_anexos(ruta))
+
+
+def cargar_artefacto(nombre, construir, leer, escribir, ruta=cl.RUTA_DATOS, combinar=None, lexicos=(),
+                     modelo=None, **opciones):
+    # Resultados derivados de la tabla (cubos, índices...). Si solo se añadieron anexos desde que se
+    # guardaron, `combinar` los actualiza leyendo únicamente las partes nuevas. Los que usan `lexicos`
+    # o un `modelo` (su versión, p. ej. Sentimiento_Biblio.version()) se reconstruyen cuando cambian.
+    with mt.medir(f'artefacto:{nombre}') as registro:
+        base = _ruta_cache(ruta, **opciones)
+        tabla = _leer_meta(base)
+        destino = f'{base}.{nombre}'
+        meta = _leer_meta(destino)
+        dependencias = ([lx.version(*lexicos)] if lexicos else []) + ([modelo] if modelo else [])
+        dependencias = '+'.join(dependencias) or None
+        resultado = None
+
+        if tabla is not None and meta is not None and meta.get('dependencias') == dependencias:
+            versiones = [tabla['sha1']] + [a['version'] for a in tabla['anexos']]
+            try:
+                if meta.get('version') == tabla['version']:
+                    registro['cache'] = 'hit'
+                    return leer(destino)
+                if combinar is not None and meta.get('version') in versiones:
+                    resultado = leer(destino)
+                    for anexo in tabla['anexos'][versiones.index(meta['version']):]:
+                        nuevos = pd.read_parquet(os.path.join(base + '.partes', f"{anexo['sha1']}.parquet"))
+                        resultado = combinar(resultado, nuevos)
+                    registro['cache'] = 'parcial'
+            except (ImportError, OSError, ValueError):
+                resultado = None
+
+        if resultado is None:
+            registro['cache'] = 'miss'
+            resultado = construir()
+        if tabla is not None:
+            try:
+                escribir(resultado, destino)
+                _escribir_meta(destino, {'version': tabla['version'], 'dependencias': dependencias})
+            except (ImportError, OSError):
+                pass
+        return resultado
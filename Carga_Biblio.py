@@ -0,0 +1,142 @@
+import json
+import pandas as pd
+import Metricas_Biblio as mt
+
+RUTA_DATOS = 'comentarios_cubadebate.json'
+COLUMNAS = ['titulo_noticia', 'categoria', 'fecha_comentario', 'contenido_comentario', 'usuario']
+TAMANO_LECTURA = 1 << 20
+TAMANO_BLOQUE = 100_000
+
+
+class _Lector:
+    # Recorre el JSON por partes: solo mantiene en memoria el fragmento que se está decodificando.
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.buffer = ''
+        self.pos = 0
+        self.fin = False
+        self.decodificador = json.JSONDecoder()
+
+    def _leer_mas(self, minimo=TAMANO_LECTURA):
+        if self.pos > len(self.buffer) // 2:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        fragmento = self.archivo.read(max(minimo, TAMANO_LECTURA))
+        if not fragmento:
+            self.fin = True
+        self.buffer += fragmento
+
+    def caracter(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.fin:
+                raise json.JSONDecodeError("Fin de archivo inesperado", self.buffer, self.pos)
+            self._leer_mas()
+
+    def esperar(self, simbolo):
+        if self.caracter() != simbolo:
+            raise json.JSONDecodeError(f"Se esperaba '{simbolo}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def valor(self):
+        self.caracter()
+        while True:
+            try:
+                valor, fin = self.decodificador.raw_decode(self.buffer, self.pos)
+                if fin < len(self.buffer) or self.fin:
+                    self.pos = fin
+                    return valor
+            except json.JSONDecodeError:
+                if self.fin:
+                    raise
+            self._leer_mas(len(self.buffer) - self.pos)
+
+    def claves(self):
+        self.esperar('{')
+        if self.caracter() == '}':
+            self.pos += 1
+            return
+        while True:
+            clave = self.valor()
+            self.esperar(':')
+            yield clave
+            if self.caracter() == ',':
+                self.pos += 1
+                continue
+            self.esperar('}')
+            return
+
+    def elementos(self):
+        self.esperar('[')
+        if self.caracter() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.valor()
+            if self.caracter() == ',':
+                self.pos += 1
+                continue
+            self.esperar(']')
+            return
+
+
+def iterar_noticias(archivo):
+    lector = _Lector(archivo)
+    encontrado = False
+    for clave in lector.claves():
+        if clave != 'analisis_comentarios':
+            lector.valor()
+            continue
+        for subclave in lector.claves():
+            if subclave != 'comentarios':
+                lector.valor()
+                continue
+            encontrado = True
+            yield from lector.elementos()
+    if not encontrado:
+        raise KeyError('analisis_comentarios.comentarios')
+
+
+def _buffers_vacios():
+    return {columna: [] for columna in COLUMNAS}
+
+
+def leer_bloques(ruta=RUTA_DATOS, categorias=None, tamano_bloque=TAMANO_BLOQUE):
+    if categorias is not None:
+        categorias = {c.lower() for c in categorias}
+
+    buffers = _buffers_vacios()
+    with open(ruta, 'r', encoding='utf-8') as archivo:
+        for noticia in iterar_noticias(archivo):
+            categoria = noticia.get('categoria', '')
+            if categorias is not None and categoria.lower() not in categorias:
+                continue
+
+            titulo = noticia.get('titulo_noticia', 'Sin título')
+            for comentario in noticia.get('comentarios') or []:
+                contenido = comentario.get('contenido')
+                buffers['titulo_noticia'].append(titulo)
+                buffers['categoria'].append(categoria)
+                buffers['fecha_comentario'].append(comentario.get('fecha') or None)
+                buffers['contenido_comentario'].append(contenido if isinstance(contenido, str) else '')
+                buffers['usuario'].append(comentario.get('autor', 'Anónimo'))
+
+                if len(buffers['usuario']) >= tamano_bloque:
+                    yield pd.DataFrame(buffers, columns=COLUMNAS)
+                    buffers = _buffers_vacios()
+
+    if buffers['usuario']:
+        yield pd.DataFrame(buffers, columns=COLUMNAS)
+
+
+@mt.instrumentar
+def cargar_comentarios(ruta=RUTA_DATOS, categorias=None, tamano_bloque=TAMANO_BLOQUE):
+    bloques = list(leer_bloques(ruta, categorias, tamano_bloque))
+    if not bloques:
+        return pd.DataFrame(columns=COLUMNAS)
+    if len(bloques) == 1:
+        return bloques[0]
+    return pd.concat(bloques, ignore_index=True)
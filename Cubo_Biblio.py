@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import Lexico_Biblio as lx
+import Cache_Biblio as cache
+import Paralelo_Biblio as pl
+import Metricas_Biblio as mt
+
+PRECISION = 11
+REGISTROS = 1 << PRECISION
+BITS_RANGO = 50
+LEXICOS = ('emociones_basicas', 'violencia')
+
+
+def registros_hll(grupos, valores, n_grupos):
+    # HyperLogLog: los primeros bits del hash eligen el registro, el resto da el rango.
+    hashes = pd.util.hash_array(np.asarray(valores, dtype=object))
+    indices = (hashes >> np.uint64(64 - PRECISION)).astype(np.int64)
+    restos = (hashes & np.uint64((1 << BITS_RANGO) - 1)).astype(np.float64)
+    _, exponentes = np.frexp(restos)
+    rangos = (BITS_RANGO + 1 - exponentes).astype(np.uint8)
+
+    registros = np.zeros((n_grupos, REGISTROS), dtype=np.uint8)
+    np.maximum.at(registros, (np.asarray(grupos, dtype=np.int64), indices), rangos)
+    return registros
+
+
+def estimar_hll(registros):
+    if registros.ndim == 2:
+        registros = registros.max(axis=0) if len(registros) else np.zeros(REGISTROS, dtype=np.uint8)
+    alfa = 0.7213 / (1 + 1.079 / REGISTROS)
+    estimacion = alfa * REGISTROS ** 2 / np.sum(np.ldexp(1.0, -registros.astype(np.int64)))
+    vacios = np.count_nonzero(registros == 0)
+    if estimacion <= 2.5 * REGISTROS and vacios:
+        estimacion = REGISTROS * np.log(REGISTROS / vacios)
+    return int(round(estimacion))
+
+
+def _ordenar_usuarios(usuarios, registros):
+    # Orden fijo por (fecha, categoría) para que el resultado no dependa de cómo se fragmentó la tabla.
+    orden = usuarios.sort_values(['fecha', 'categoria'], na_position='last', kind='stable').index.to_numpy()
+    return usuarios.iloc[orden].reset_index(drop=True), registros[orden]
+
+
+def _construir(df):
+    fechas = df['fecha_comentario'].dt.normalize().rename('fecha')
+    lexicos = lx.contar(df['contenido_comentario'], *LEXICOS)
+
+    medidas = pd.DataFrame({'comentarios': np.ones(len(df), dtype=np.int32)}, index=df.index)
+    for emocion in lx.LEXICOS['emociones_basicas']:
+        medidas[f'emocion_{emocion}'] = (lexicos[lx.normalizar(emocion)] > 0).astype(np.int32)
+    medidas['violencia'] = lx.sumar(lexicos, 'violencia').astype(np.int32)
+
+    claves = [fechas, df['categoria'], df['titulo_noticia']]
+    celdas = medidas.groupby(claves, observed=True, dropna=False).sum().reset_index()
+
+    codigos, claves_usuarios = pd.factorize(pd.MultiIndex.from_arrays([fechas, df['categoria']]),
+                                            use_na_sentinel=False)
+    usuarios = claves_usuarios.to_frame(index=False, name=['fecha', 'categoria'])
+    usuarios['categoria'] = usuarios['categoria'].astype(df['categoria'].dtype)
+    registros = registros_hll(codigos, df['usuario'].astype(str).to_numpy(), len(usuarios))
+    usuarios, registros = _ordenar_usuarios(usuarios, registros)
+
+    return {'celdas': celdas, 'usuarios': usuarios, 'registros': registros}
+
+
+def fusionar(cubos):
+    # Las celdas se suman y los registros HyperLogLog se combinan con el máximo: el resultado es
+    # idéntico al de construir el cubo con todas las filas juntas.
+    claves = ['fecha', 'categoria', 'titulo_noticia']
+    celdas = cache.concatenar([c['celdas'] for c in cubos])
+    celdas = celdas.groupby(claves, observed=True, dropna=False).sum().reset_index()
+
+    usuarios = cache.concatenar([c['usuarios'] for c in cubos])
+    codigos, claves_usuarios = pd.factorize(pd.MultiIndex.from_frame(usuarios), use_na_sentinel=False)
+    registros = np.zeros((len(claves_usuarios), REGISTROS), dtype=np.uint8)
+    np.maximum.at(registros, codigos, np.vstack([c['registros'] for c in cubos]))
+    usuarios = claves_usuarios.to_frame(index=False, name=['fecha', 'categoria'])
+    usuarios['categoria'] = usuarios['categoria'].astype(celdas['categoria'].dtype)
+    usuarios, registros = _ordenar_usuarios(usuarios, registros)
+    return {'celdas': celdas, 'usuarios': usuarios, 'registros': registros}
+
+
+@mt.instrumentar
+def construir_cubo(df, procesos=None):
+    # Fragmentos por día: cada proceso agrega sus días y los cubos parciales se fusionan. Los léxicos se
+    # cuentan antes de repartir, así los procesos heredan los conteos guardados en lugar de leerlos.
+    lx.contar(df['contenido_comentario'], *LEXICOS)
+    return pl.agregar(_construir, fusionar, df, procesos, clave='dia')
+
+
+@mt.instrumentar
+def combinar(cubo, nuevos):
+    return fusionar([cubo, construir_cubo(nuevos)])
+
+
+def mascara(tabla, categoria=None, rango_fechas=None):
+    seleccion = np.ones(len(tabla), dtype=bool)
+    if categoria is not None:
+        seleccion &= (tabla['categoria'] == categoria).to_numpy()
+    if rango_fechas is not None:
+        inicio, fin = (pd.Timestamp(f) for f in rango_fechas)
+        seleccion &= ((tabla['fecha'] >= inicio) & (tabla['fecha'] <= fin)).to_numpy()
+    return seleccion
+
+
+def filtrar(cubo, categoria=None, rango_fechas=None):
+    return cubo['celdas'][mascara(cubo['celdas'], categoria, rango_fechas)]
+
+
+def usuarios_unicos(cubo, categoria=None, rango_fechas=None):
+    return estimar_hll(cubo['registros'][mascara(cubo['usuarios'], categoria, rango_fechas)])
+
+
+def guardar_cubo(cubo, destino):
+    cubo['celdas'].to_parquet(destino + '.celdas.parquet', index=False)
+    usuarios = cubo['usuarios'].assign(registros=[fila.tobytes() for fila in cubo['registros']])
+    usuarios.to_parquet(destino + '.usuarios.parquet', index=False)
+
+
+def leer_cubo(destino):
+    celdas = pd.read_parquet(destino + '.celdas.parquet')
+    usuarios = pd.read_parquet(destino + '.usuarios.parquet')
+    registros = np.frombuffer(b''.join(usuarios.pop('registros')), dtype=np.uint8).reshape(-1, REGISTROS)
+    return {'celdas': celdas, 'usuarios': usuarios, 'registros': registros.copy()}
@@ -1,5 +1,16 @@
 import streamlit as st
 import Data_Biblio as mb
+import Autores_Biblio as au
+import Cache_Biblio as cache
+import Cubo_Biblio as cb
+import Duplicados_Biblio as dp
+import Frecuencias_Biblio as fr
+import Indice_Biblio as ix
+import Metricas_Biblio as mt
+import Picos_Biblio as pk
+import Sentimiento_Biblio as sentimiento
+import Temas_Biblio as tm
+import numpy as np
 import pandas as pd
 import json
 from PIL import Image
@@ -17,26 +28,24 @@ except FileNotFoundError:
     st.sidebar.warning("Logo no encontrado. Asegúrate de tener 'Logo.jpg' en la misma carpeta.")
 
 st.title("📢 EcoCubano: Análisis de Comentarios")
+mt.reiniciar()
 
-@st.cache_data
-def cargar_datos():
+# Resultados por (análisis, filtros, versión de los datos) que se guardan antes de descartar los más antiguos.
+MEMO_ENTRADAS = 32
+# Versiones de los datos que se mantienen cargadas (tabla y artefactos): al llegar un anexo la anterior se libera.
+VERSIONES_EN_MEMORIA = 1
+SECCIONES = [
+    "📊 Estadísticas Generales", 
+    "⏳ Análisis Temporal", 
+    "📝 Análisis de Contenido", 
+    "🔍 Análisis Específico"
+]
+
+# cache_resource comparte la tabla entre ejecuciones sin copiarla; nada de lo que sigue la modifica.
+@mt.cachear(st.cache_resource(max_entries=VERSIONES_EN_MEMORIA))
+def cargar_datos(huella):
     try:
-        with open('comentarios_cubadebate.json', 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        
-        noticias = data["analisis_comentarios"]["comentarios"]
-        datos_aplanados = []
-        
-        for noticia in noticias:
-            for comentario in noticia["comentarios"]:
-                datos_aplanados.append({
-                    "titulo_noticia": noticia["titulo_noticia"],
-                    "categoria": noticia["categoria"],
-                    "fecha_comentario": comentario.get("fecha", "Sin fecha"),
-                    "contenido_comentario": comentario.get("contenido", ""),
-                    "usuario": comentario.get("autor", "Anónimo")  
-                })
-        return pd.DataFrame(datos_aplanados)
+        return cache.cargar_tabla('comentarios_cubadebate.json')
     
     except FileNotFoundError:
         st.error("Archivo 'comentarios_cubadebate.json' no encontrado")
@@ -48,28 +57,158 @@ def cargar_datos():
         st.error(f"Estructura del JSON incorrecta. Falta la clave: {e}")
         return pd.DataFrame()
 
-df = cargar_datos()
+# El cubo se comparte sin copiar: cb.filtrar y cb.usuarios_unicos solo lo leen.
+@mt.cachear(st.cache_resource(max_entries=VERSIONES_EN_MEMORIA))
+def cargar_cubo(huella):
+    return cache.cargar_artefacto(
+        'cubo',
+        lambda: cb.construir_cubo(cargar_datos(huella)),
+        cb.leer_cubo,
+        cb.guardar_cubo,
+        'comentarios_cubadebate.json',
+        combinar=cb.combinar,
+        lexicos=cb.LEXICOS
+    )
 
-if not df.empty:
-    df['fecha_comentario'] = pd.to_datetime(df['fecha_comentario'], errors='coerce')
-    df['dia_semana'] = df['fecha_comentario'].dt.day_name(locale='es')
-    df['longitud'] = df['contenido_comentario'].str.len()
-else:
+# Artefactos de solo lectura: cache_resource los comparte sin copiarlos en cada ejecución, como la tabla.
+@mt.cachear(st.cache_resource(max_entries=VERSIONES_EN_MEMORIA))
+def cargar_indice_duplicados(huella):
+    return cache.cargar_artefacto(
+        'casi_duplicados',
+        lambda: dp.construir_indice(cargar_datos(huella)),
+        dp.leer_indice,
+        dp.guardar_indice,
+        'comentarios_cubadebate.json',
+        combinar=dp.actualizar_indice
+    )
+
+@mt.cachear(st.cache_resource(max_entries=VERSIONES_EN_MEMORIA))
+def cargar_frecuencias(huella):
+    return cache.cargar_artefacto(
+        'frecuencias',
+        lambda: fr.tabla_frecuencias(cargar_datos(huella)),
+        fr.leer_frecuencias,
+        fr.guardar_frecuencias,
+        'comentarios_cubadebate.json',
+        combinar=fr.combinar
+    )
+
+@mt.cachear(st.cache_resource(max_entries=VERSIONES_EN_MEMORIA))
+def cargar_indice_texto(huella):
+    return cache.cargar_artefacto(
+        'indice_texto',
+        lambda: ix.construir_indice(cargar_datos(huella)),
+        ix.leer_indice,
+        ix.guardar_indice,
+        'comentarios_cubadebate.json',
+        combinar=ix.combinar
+    )
+
+@mt.cachear(st.cache_resource(max_entries=VERSIONES_EN_MEMORIA))
+def cargar_autores(huella):
+    return cache.cargar_artefacto(
+        'autores',
+        lambda: au.construir_autores(cargar_datos(huella)),
+        au.leer_autores,
+        au.guardar_autores,
+        'comentarios_cubadebate.json',
+        combinar=au.combinar,
+        lexicos=au.LEXICOS,
+        modelo=sentimiento.version()
+    )
+
+@mt.cachear(st.cache_resource(max_entries=VERSIONES_EN_MEMORIA))
+def cargar_temas(huella):
+    return cache.cargar_artefacto(
+        'temas',
+        lambda: tm.construir_temas(cargar_datos(huella)),
+        tm.leer_temas,
+        tm.guardar_temas,
+        'comentarios_cubadebate.json',
+        combinar=tm.combinar
+    )
+
+@mt.cachear(st.cache_resource(max_entries=VERSIONES_EN_MEMORIA))
+def cargar_picos(huella):
+    return cache.cargar_artefacto(
+        'picos',
+        lambda: pk.construir_detector(cargar_datos(huella)),
+        pk.leer_detector,
+        pk.guardar_detector,
+        'comentarios_cubadebate.json',
+        combinar=pk.combinar
+    )
+
+@mt.cachear(st.cache_resource(max_entries=MEMO_ENTRADAS))
+def filtrar_datos(huella, categoria, fechas):
+    df = cargar_datos(huella)
+    mascara = np.ones(len(df), dtype=bool)
+    
+    if categoria is not None:
+        mascara &= (df['categoria'] == categoria).to_numpy()
+    
+    if fechas is not None:
+        mascara &= df['dia'].between(cache.dia_ordinal(fechas[0]), cache.dia_ordinal(fechas[1])).to_numpy()
+    
+    return (df if mascara.all() else df[mascara]), mascara
+
+@mt.cachear(st.cache_resource(max_entries=MEMO_ENTRADAS))
+def texto_minusculas(huella, categoria, fechas):
+    return filtrar_datos(huella, categoria, fechas)[0]['contenido_comentario'].str.lower()
+
+@mt.cachear(st.cache_data(max_entries=MEMO_ENTRADAS))
+def grafico_cubo(huella, categoria, fechas, grafico, *args):
+    # Las figuras del cubo se guardan ya serializadas por filtro: al volver a un filtro no se rehacen.
+    return getattr(mb, grafico)(cb.filtrar(cargar_cubo(huella), categoria, fechas), *args)
+
+@mt.cachear(st.cache_data(max_entries=MEMO_ENTRADAS))
+def grafico_sentimiento(huella, categoria, fechas):
+    return mb.analizar_sentimiento(filtrar_datos(huella, categoria, fechas)[0])
+
+@mt.cachear(st.cache_data(max_entries=MEMO_ENTRADAS))
+def grafico_nube(huella, categoria, fechas):
+    return mb.generar_nube_palabras(fr.frecuencias(cargar_frecuencias(huella), categoria, fechas))
+
+@mt.cachear(st.cache_data(max_entries=MEMO_ENTRADAS))
+def grafico_palabras_clave(huella, categoria, fechas, palabras):
+    df_filtrado, _ = filtrar_datos(huella, categoria, fechas)
+    return mb.evolucion_palabras_clave(df_filtrado, list(palabras), cargar_indice_texto(huella))
+
+@mt.cachear(st.cache_data(max_entries=MEMO_ENTRADAS))
+def grafico_repetidos(huella, categoria, fechas, top_n):
+    df_filtrado, _ = filtrar_datos(huella, categoria, fechas)
+    return mb.identificar_comentarios_repetidos(df_filtrado, top_n, texto_minusculas(huella, categoria, fechas))
+
+@mt.cachear(st.cache_data(max_entries=MEMO_ENTRADAS))
+def grafico_casi_identicos(huella, categoria, fechas, similitud, top_n):
+    df_filtrado, _ = filtrar_datos(huella, categoria, fechas)
+    grupos = dp.grupos_similares(cargar_indice_duplicados(huella), similitud, claves=df_filtrado['clave'])
+    return mb.plot_comentarios_casi_identicos(grupos, df_filtrado, top_n)
+
+try:
+    huella = cache.huella_fuente('comentarios_cubadebate.json')
+except FileNotFoundError:
+    huella = None
+df = cargar_datos(huella)
+
+if df.empty:
     st.warning("No se pudieron cargar los datos. Verifica el archivo de entrada.")
     st.stop()
 
+cubo = cargar_cubo(huella)
+
 with st.sidebar:
     st.header("🔍 Filtros Avanzados")
     
-    categorias = ['Todas'] + sorted(df['categoria'].unique().tolist())
+    categorias = ['Todas'] + sorted(cubo['usuarios']['categoria'].dropna().unique().tolist())
     categoria = st.selectbox(
         "Categoría:",
         options=categorias,
         index=0
     )
     
-    fecha_min = df['fecha_comentario'].min().date()
-    fecha_max = df['fecha_comentario'].max().date()
+    fecha_min = cubo['celdas']['fecha'].min().date()
+    fecha_max = cubo['celdas']['fecha'].max().date()
     rango_fechas = st.date_input(
         "Rango de fechas:",
         value=(fecha_min, fecha_max),
@@ -84,70 +223,122 @@ with st.sidebar:
     
     st.header("⚙️ Configuración")
     top_n = st.slider("Top noticias a mostrar:", 3, 10, 5)
+    similitud = st.slider("Similitud mínima entre comentarios casi idénticos:", 0.5, 1.0, 0.8, 0.05)
     mostrar_nube = st.checkbox("Mostrar nube de palabras", True)
     mostrar_sentimiento = st.checkbox("Mostrar análisis de sentimiento", True)
+    mostrar_tiempos = st.checkbox("Mostrar tiempos de ejecución (depuración)", False)
+    
+    fechas = cache.resumen_fechas(df)
+    if fechas and fechas['sin_fecha'] + fechas['invalidas']:
+        st.caption(f"{fechas['sin_fecha'] + fechas['invalidas']} de {fechas['total']} comentarios no tienen "
+                   "una fecha válida y no aparecen en los filtros ni en los análisis por fecha.")
 
-df_filtrado = df.copy()
-
-if categoria != 'Todas':
-    df_filtrado = df_filtrado[df_filtrado['categoria'] == categoria]
+filtro_categoria = categoria if categoria != 'Todas' else None
+filtro_fechas = rango_fechas if len(rango_fechas) == 2 else None
+celdas = cb.filtrar(cubo, filtro_categoria, filtro_fechas)
 
-if len(rango_fechas) == 2:
-    df_filtrado = df_filtrado[
-        (df_filtrado['fecha_comentario'].dt.date >= rango_fechas[0]) &
-        (df_filtrado['fecha_comentario'].dt.date <= rango_fechas[1])
-    ]
+# Solo se calcula la sección visible; st.tabs ejecutaría las cuatro en cada interacción.
+seccion = st.radio("Sección:", SECCIONES, horizontal=True, label_visibility='collapsed')
 
-tab1, tab2, tab3, tab4 = st.tabs([
-    "📊 Estadísticas Generales", 
-    "⏳ Análisis Temporal", 
-    "📝 Análisis de Contenido", 
-    "🔍 Análisis Específico"
-])
-
-with tab1:
+if seccion == SECCIONES[0]:
     st.subheader("Métricas Clave")
     col1, col2 = st.columns(2)
     with col1:
-        st.metric("Comentarios analizados", len(df_filtrado))
+        st.metric("Comentarios analizados", int(celdas['comentarios'].sum()))
     with col2:
-        st.metric("Usuarios únicos", df_filtrado['usuario'].nunique())
+        st.metric("Usuarios únicos", cb.usuarios_unicos(cubo, filtro_categoria, filtro_fechas))
     
     st.subheader("Distribución por Categoría")
-    st.plotly_chart(mb.plot_comentarios_por_categoria(df_filtrado), use_container_width=True)
+    st.plotly_chart(grafico_cubo(huella, filtro_categoria, filtro_fechas, 'plot_comentarios_por_categoria'), use_container_width=True)
     
     st.subheader(f"Top {top_n} Noticias con Más Comentarios")
-    st.plotly_chart(mb.plot_top_noticias(df_filtrado, top_n), use_container_width=True)
+    st.plotly_chart(grafico_cubo(huella, filtro_categoria, filtro_fechas, 'plot_top_noticias', top_n), use_container_width=True)
+    
+    st.subheader(f"Top {top_n} Autores Más Activos")
+    st.caption("En todo el período, según la categoría elegida. Porcentajes de narrativa y emoción de sus comentarios.")
+    st.dataframe(au.mas_activos(cargar_autores(huella), filtro_categoria, top_n), hide_index=True,
+                 use_container_width=True)
 
-with tab2:
+elif seccion == SECCIONES[1]:
+    detector = cargar_picos(huella)
+    recientes = pk.picos(detector, desde=pd.Timestamp(fecha_max) - pd.Timedelta(days=pk.MINIMO_DIAS))
+    principales = pk.noticias_pico(detector, recientes['fecha'], top_n=1).set_index('fecha')['titulo_noticia']
+    for pico in recientes.itertuples():
+        st.warning(f"Pico de comentarios el {pico.fecha:%d/%m/%Y}: {pico.conteo} comentarios "
+                   f"(se esperaban unos {pico.esperado:.0f}). Noticia principal: {principales.get(pico.fecha, '-')}")
+    
     st.subheader("Tendencia Temporal de Comentarios")
-    st.plotly_chart(mb.plot_tendencia_temporal(df_filtrado), use_container_width=True)
+    st.plotly_chart(grafico_cubo(huella, filtro_categoria, filtro_fechas, 'plot_tendencia_temporal'), use_container_width=True)
     
     st.subheader("Actividad por Día de la Semana")
-    st.plotly_chart(mb.plot_comentarios_por_dia(df_filtrado), use_container_width=True)
+    st.plotly_chart(grafico_cubo(huella, filtro_categoria, filtro_fechas, 'plot_comentarios_por_dia'), use_container_width=True)
+    
+    with st.expander("Picos de actividad detectados"):
+        todos = pk.picos(detector)
+        principales = pk.noticias_pico(detector, todos['fecha'], top_n=1)
+        st.dataframe(todos.merge(principales[['fecha', 'titulo_noticia']], on='fecha', how='left'),
+                     hide_index=True, use_container_width=True)
 
-with tab3:
+elif seccion == SECCIONES[2]:
     if mostrar_sentimiento:
         st.subheader("Análisis de Sentimiento")
-        st.plotly_chart(mb.analizar_sentimiento(df_filtrado), use_container_width=True)
+        st.plotly_chart(grafico_sentimiento(huella, filtro_categoria, filtro_fechas), use_container_width=True)
     
     st.subheader("Distribución de Emociones")
-    st.plotly_chart(mb.plot_radar_emociones(df_filtrado), use_container_width=True)
+    st.plotly_chart(grafico_cubo(huella, filtro_categoria, filtro_fechas, 'plot_radar_emociones'), use_container_width=True)
     
     if mostrar_nube:
         st.subheader("Nube de Palabras Más Frecuentes")
-        st.pyplot(mb.generar_nube_palabras(df_filtrado), use_container_width=True)
+        st.pyplot(grafico_nube(huella, filtro_categoria, filtro_fechas), use_container_width=True)
+    
+    st.subheader("Temas de Conversación")
+    try:
+        temas = cargar_temas(huella)
+    except ImportError:
+        st.info("Instala scikit-learn para agrupar los comentarios por tema.")
+    else:
+        _, mascara = filtrar_datos(huella, filtro_categoria, filtro_fechas)
+        tabla_temas = tm.describir(temas, mascara)
+        st.dataframe(tabla_temas, hide_index=True, use_container_width=True)
+        descripciones = tabla_temas.set_index('tema')['terminos']
+        tema = st.selectbox("Ver comentarios del tema:", tabla_temas['tema'],
+                            format_func=lambda t: f"{t}: {descripciones[t]}")
+        filas = np.flatnonzero(mascara & (temas['temas'] == tema))
+        st.dataframe(
+            df.iloc[filas[:200]][['fecha_comentario', 'categoria', 'titulo_noticia', 'usuario', 'contenido_comentario']],
+            use_container_width=True
+        )
 
-with tab4:
+else:
     st.subheader("Evolución de Palabras Clave")
-    st.plotly_chart(mb.evolucion_palabras_clave(
-        df_filtrado, 
-        [p.strip() for p in palabras_clave.split(",")]
-    ), use_container_width=True)
+    palabras = tuple(p.strip() for p in palabras_clave.split(","))
+    st.plotly_chart(grafico_palabras_clave(huella, filtro_categoria, filtro_fechas, palabras), use_container_width=True)
+    
+    consulta = st.text_input("Mostrar comentarios que contengan:", "")
+    if consulta.strip():
+        _, mascara = filtrar_datos(huella, filtro_categoria, filtro_fechas)
+        filas = ix.buscar(cargar_indice_texto(huella), consulta)
+        coincidencias = df.iloc[filas[mascara[filas]]]
+        st.caption(f"{len(coincidencias)} comentarios encontrados")
+        st.dataframe(
+            coincidencias[['fecha_comentario', 'categoria', 'titulo_noticia', 'usuario', 'contenido_comentario']].head(200),
+            use_container_width=True
+        )
     
     st.subheader("Análisis de Lenguaje Violento")
-    st.plotly_chart(mb.analizar_violencia(df_filtrado), use_container_width=True)
+    st.plotly_chart(grafico_cubo(huella, filtro_categoria, filtro_fechas, 'plot_violencia_por_categoria'), use_container_width=True)
     
     st.subheader(f"Top {top_n} Comentarios Más Repetidos")
-    st.plotly_chart(mb.identificar_comentarios_repetidos(df_filtrado, top_n), use_container_width=True)
+    st.plotly_chart(grafico_repetidos(huella, filtro_categoria, filtro_fechas, top_n), use_container_width=True)
+    
+    st.subheader(f"Top {top_n} Grupos de Comentarios Casi Idénticos")
+    st.plotly_chart(
+        grafico_casi_identicos(huella, filtro_categoria, filtro_fechas, similitud, top_n),
+        use_container_width=True
+    )
 
+mt.exportar(aplicacion='DataProduct')
+if mostrar_tiempos:
+    with st.sidebar.expander("⏱️ Tiempos de esta ejecución", expanded=True):
+        st.caption(f"Total medido: {mt.total():.2f} s")
+        st.dataframe(mt.tabla(sangrada=True), hide_index=True, use_container_width=True)
@@ -1,26 +1,37 @@
 import plotly.express as px
 import pandas as pd
-from textblob import TextBlob
+import Sentimiento_Biblio as sentimiento
+import Cache_Biblio as cache
+import Lexico_Biblio as lx
+import Indice_Biblio as ix
+import Graficos_Biblio as gr
+import numpy as np
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud
+import Metricas_Biblio as mt
 
-def plot_comentarios_por_categoria(df):
-    conteo = df['categoria'].value_counts().reset_index()
+@mt.instrumentar
+def plot_comentarios_por_categoria(celdas):
+    conteo = celdas.groupby('categoria', observed=True)['comentarios'].sum().reset_index(name='count')
+    conteo = conteo[conteo['count'] > 0].sort_values('count', ascending=False)
     fig = px.bar(conteo, x='categoria', y='count', 
                  title='Comentarios por Categoría',
                  labels={'categoria': 'Categoría', 'count': 'Total Comentarios'})
     return fig
 
-def plot_tendencia_temporal(df):
-    df['fecha_comentario'] = pd.to_datetime(df['fecha_comentario'], errors='coerce')
-    df_fecha = df.groupby(df['fecha_comentario'].dt.date).size().reset_index(name='count')
+@mt.instrumentar
+def plot_tendencia_temporal(celdas):
+    df_fecha = celdas.groupby('fecha')['comentarios'].sum().reset_index(name='count')
+    df_fecha = gr.reducir(df_fecha.rename(columns={'fecha': 'fecha_comentario'}), ['count'], 'fecha_comentario')
     fig = px.line(df_fecha, x='fecha_comentario', y='count',
                   title='Tendencia de Comentarios',
                   labels={'fecha_comentario': 'Fecha', 'count': 'Comentarios'})
     return fig
 
-def plot_top_noticias(df, top_n=10):
-    top_noticias = df['titulo_noticia'].value_counts().head(top_n).reset_index()
+@mt.instrumentar
+def plot_top_noticias(celdas, top_n=10):
+    top_noticias = celdas.groupby('titulo_noticia', observed=True)['comentarios'].sum()
+    top_noticias = top_noticias[top_noticias > 0].nlargest(top_n).reset_index()
     top_noticias.columns = ['titulo_noticia', 'total_comentarios']
     
     fig = px.bar(
@@ -39,10 +50,11 @@ def plot_top_noticias(df, top_n=10):
     
     return fig
 
-def plot_comentarios_por_dia(df):
-    df['dia_semana'] = pd.to_datetime(df['fecha_comentario']).dt.day_name(locale='es')
-    orden_dias = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-    conteo = df['dia_semana'].value_counts().reindex(orden_dias).reset_index()
+@mt.instrumentar
+def plot_comentarios_por_dia(celdas):
+    por_fecha = celdas.groupby('fecha')['comentarios'].sum()
+    conteo = por_fecha.groupby(por_fecha.index.dayofweek).sum().reindex(range(7))
+    conteo = pd.DataFrame({'dia_semana': cache.DIAS_SEMANA, 'count': conteo.to_numpy()})
     
     fig = px.bar(conteo, 
                  x='dia_semana', 
@@ -50,74 +62,51 @@ def plot_comentarios_por_dia(df):
                  title='Comentarios por Día de la Semana')
     return fig
 
-def plot_radar_emociones(df):
-    emociones = ['alegria', 'tristeza', 'enojo', 'sorpresa', 'miedo']
-    conteo = [df['contenido_comentario'].str.contains(e, case=False).sum() for e in emociones]  
+@mt.instrumentar
+def plot_radar_emociones(celdas):
+    emociones = lx.LEXICOS['emociones_basicas']
+    conteo = [celdas[f'emocion_{e}'].sum() for e in emociones]
     fig = px.line_polar(r=conteo, theta=emociones, line_close=True, title='Distribución de Emociones')
     return fig  
 
-def evolucion_palabras_clave(df, palabras):
-    df['fecha'] = pd.to_datetime(df['fecha_comentario'])
-    for palabra in palabras:
-        df[palabra] = df['contenido_comentario'].str.contains(palabra, case=False)
-    fig = px.line(df.groupby(df['fecha'].dt.date)[palabras].sum(), title='Evolución de Términos Clave')
+def _filas_indice(df, indice):
+    # Las filas del índice son posiciones en la tabla completa; None si df es la tabla completa.
+    return None if len(df) == len(indice['dias']) else df.index.to_numpy()
+
+@mt.instrumentar
+def evolucion_palabras_clave(df, palabras, indice=None):
+    palabras = list(dict.fromkeys(p.lower() for p in palabras if p))
+    if indice is None:
+        presencia = lx.contar_terminos(df['contenido_comentario'], palabras) > 0
+        evolucion = presencia.groupby(df['fecha_comentario'].dt.normalize()).sum()
+        evolucion.index = evolucion.index.date
+        evolucion.index.name = 'fecha_comentario'
+    else:
+        filas = _filas_indice(df, indice)
+        fechas = df['fecha_comentario'].dropna().dt.normalize().unique()
+        evolucion = pd.DataFrame({p: ix.dias_con(indice, p, filas) for p in palabras}, columns=palabras)
+        evolucion = evolucion.reindex(sorted(fechas)).fillna(0).astype(int)
+        evolucion.index = evolucion.index.date
+        evolucion.index.name = 'fecha_comentario'
+    fig = px.line(gr.reducir(evolucion, evolucion.columns), title='Evolución de Términos Clave')
     return fig
 
+@mt.instrumentar
 def analizar_sentimiento(df):
-    df['contenido_comentario'] = df['contenido_comentario'].fillna("")
-
-    sentimientos = []
-    for comentario in df['contenido_comentario']:
-        if comentario.strip() == "":  
-            sentimientos.append(0.0)  
-        else:
-            blob = TextBlob(comentario)  
-            sentimientos.append(blob.sentiment.polarity)
-    
-    df['sentimiento'] = sentimientos  
-    categorias = []
-    for valor in df['sentimiento']:
-        if valor > 0:
-            categorias.append("Positivo")
-        elif valor < 0:
-            categorias.append("Negativo")
-        else:
-            categorias.append("Neutral")
+    categorias = sentimiento.categorizar(sentimiento.polaridades(df['contenido_comentario']))
+    conteo = categorias.value_counts().reset_index()
+    conteo = conteo[conteo['count'] > 0]
     
-    df['sentimiento_categoria'] = categorias  
-    
-    fig = px.pie(df, names='sentimiento_categoria', title='Distribución de Sentimientos')
+    fig = px.pie(conteo, names='sentimiento_categoria', values='count', title='Distribución de Sentimientos')
     return fig
 
-def generar_nube_palabras(df):
-    palabras_excluidas = {
-        'yo', 'tú', 'él', 'ella', 'nosotros', 'vosotros', 'ellos', 'ellas', 'usted', 'ustedes',
-        'mi', 'tu', 'su', 'nuestro', 'vuestro', 'su', 'mío', 'tuyo', 'suyo',
-        'que', 'cual', 'quien', 'cuyo', 'cuanto', 'donde', 'cuando', 'como',
-        'y', 'o', 'pero', 'ni', 'que', 'si', 'aunque', 'porque', 'como',
-        'el', 'la', 'los', 'las', 'un', 'una', 'unos', 'unas',
-        'a', 'ante', 'bajo', 'cabe', 'con', 'contra', 'de', 'desde', 'en', 'entre', 
-        'hacia', 'hasta', 'para', 'por', 'según', 'sin', 'so', 'sobre', 'tras',
-        'aquí', 'allí', 'ahora', 'antes', 'después', 'hoy', 'mañana', 'ayer', 
-        'siempre', 'nunca', 'tarde', 'pronto', 'bien', 'mal', 'mejor', 'peor',
-        'muy', 'mucho', 'poco', 'bastante', 'demasiado', 'casi', 'todo', 'nada', 'porque','también','además', 'tiene', 'tienen'
-    }
-    
-    texto = ' '.join(df['contenido_comentario'].dropna().astype(str))
-    
-    palabras_filtradas = [
-        word.lower() for word in texto.split() 
-        if len(word) > 5 and word.lower() not in palabras_excluidas
-    ]
-    texto_filtrado = ' '.join(palabras_filtradas)
-    
+@mt.instrumentar
+def generar_nube_palabras(frecuencias):
     wordcloud = WordCloud(
         width=800,
         height=400,
-        background_color='white',
-        min_word_length=6,
-        stopwords=palabras_excluidas
-    ).generate(texto_filtrado)
+        background_color='white'
+    ).generate_from_frequencies(frecuencias.to_dict())
     
     fig = plt.figure(figsize=(10, 5))
     plt.imshow(wordcloud, interpolation='bilinear')
@@ -125,12 +114,18 @@ def generar_nube_palabras(df):
     plt.title('Nube de Palabras Relevantes')
     return fig
 
-def analizar_violencia(df, palabras_violencia=None):
+@mt.instrumentar
+def analizar_violencia(df, palabras_violencia=None, indice=None):
     if palabras_violencia is None:
-        palabras_violencia = ['matar', 'asesinar', 'destruir', 'violencia', 'golpear', 'apuñalar', 'estrangular', 'torturar', 'quemar', 'violar', 'atacar']
+        palabras_violencia = lx.LEXICOS['violencia']
     
-    df['violencia'] = df['contenido_comentario'].str.lower().str.count('|'.join(palabras_violencia))
-    df_violencia = df.groupby('categoria')['violencia'].sum().reset_index()
+    if indice is None:
+        violencia = lx.contar_terminos(df['contenido_comentario'], palabras_violencia).sum(axis=1)
+    else:
+        apariciones = np.concatenate([ix.ocurrencias(indice, p) for p in palabras_violencia])
+        violencia = np.bincount(apariciones, minlength=len(indice['dias']))
+        violencia = pd.Series(violencia if _filas_indice(df, indice) is None else violencia[df.index], index=df.index)
+    df_violencia = violencia.groupby(df['categoria'], observed=True).sum().reset_index(name='violencia')
     
     fig = px.pie(
         df_violencia,
@@ -140,12 +135,25 @@ def analizar_violencia(df, palabras_violencia=None):
     )
     return fig
 
-def identificar_comentarios_repetidos(df, top_n=5):
-    df['contenido_lower'] = df['contenido_comentario'].str.lower()
- 
-    repetidos = df[df.duplicated('contenido_lower', keep=False)]
+@mt.instrumentar
+def plot_violencia_por_categoria(celdas):
+    df_violencia = celdas.groupby('categoria', observed=True)['violencia'].sum().reset_index()
     
-    top_comentarios = repetidos.groupby('contenido_lower').size().nlargest(top_n).reset_index()
+    fig = px.pie(
+        df_violencia,
+        names='categoria',
+        values='violencia',
+        title='Distribución de Lenguaje Violento por Categoría'
+    )
+    return fig
+
+@mt.instrumentar
+def identificar_comentarios_repetidos(df, top_n=5, minusculas=None):
+    if minusculas is None:
+        minusculas = df['contenido_comentario'].str.lower()
+    conteo = minusculas.value_counts()
+    
+    top_comentarios = conteo[conteo > 1].head(top_n).reset_index()
     top_comentarios.columns = ['Comentario', 'Repeticiones']
 
     fig = px.bar(
@@ -158,4 +166,24 @@ def identificar_comentarios_repetidos(df, top_n=5):
     )
 
     fig.update_layout(yaxis={'categoryorder':'total ascending'})
-    return fig
\ No newline at end of file
+    return fig
+
+@mt.instrumentar
+def plot_comentarios_casi_identicos(grupos, df, top_n=5):
+    top_grupos = grupos.head(top_n).copy()
+    ejemplos = df.loc[df['clave'].isin(top_grupos['clave_ejemplo']), ['clave', 'contenido_comentario']]
+    ejemplos = ejemplos.drop_duplicates('clave').set_index('clave')['contenido_comentario']
+    top_grupos['Comentario'] = top_grupos['clave_ejemplo'].map(ejemplos).str.slice(0, 120)
+
+    fig = px.bar(
+        top_grupos,
+        x='tamano',
+        y='Comentario',
+        orientation='h',
+        hover_data=['autores'],
+        title=f'Top {top_n} Grupos de Comentarios Casi Idénticos',
+        labels={'tamano': 'Comentarios en el grupo', 'autores': 'Autores distintos', 'Comentario': 'Ejemplo del grupo'}
+    )
+
+    fig.update_layout(yaxis={'categoryorder':'total ascending'})
+    return fig
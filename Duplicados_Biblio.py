@@ -0,0 +1,196 @@
+import functools
+import os
+import re
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import Metricas_Biblio as mt
+import Paralelo_Biblio as pl
+
+PERMUTACIONES = 64
+TAMANO_SHINGLE = 2
+UMBRAL_INDICE = 0.5
+PRIMO = (1 << 31) - 1
+MULTIPLICADOR = np.uint64(0x9E3779B97F4A7C15)
+TEXTOS_POR_BLOQUE = 2_000
+PALABRA = re.compile(r'\w+')
+
+
+def _parametros_lsh(permutaciones, umbral):
+    # Bandas × filas = permutaciones; el umbral implícito de LSH es (1/bandas)^(1/filas).
+    opciones = [(b, permutaciones // b) for b in range(1, permutaciones + 1) if permutaciones % b == 0]
+    return min(opciones, key=lambda o: abs((1 / o[0]) ** (1 / o[1]) - umbral))
+
+
+def _shingles(texto, tamano):
+    palabras = PALABRA.findall(texto.lower())
+    if len(palabras) <= tamano:
+        return [' '.join(palabras)] if palabras else []
+    return [' '.join(palabras[i:i + tamano]) for i in range(len(palabras) - tamano + 1)]
+
+
+def firmas_minhash(textos, permutaciones=PERMUTACIONES, tamano_shingle=TAMANO_SHINGLE, semilla=1):
+    aleatorio = np.random.default_rng(semilla)
+    a = aleatorio.integers(1, PRIMO, permutaciones, dtype=np.uint64)
+    b = aleatorio.integers(0, PRIMO, permutaciones, dtype=np.uint64)
+
+    textos = textos.fillna('').astype(str).tolist()
+    firmas = np.full((len(textos), permutaciones), PRIMO, dtype=np.uint32)
+    for inicio in range(0, len(textos), TEXTOS_POR_BLOQUE):
+        shingles = [_shingles(t, tamano_shingle) for t in textos[inicio:inicio + TEXTOS_POR_BLOQUE]]
+        cantidades = np.array([len(s) for s in shingles])
+        if not cantidades.sum():
+            continue
+        planos = np.array([s for lista in shingles for s in lista], dtype=object)
+        x = pd.util.hash_array(planos) & np.uint64(PRIMO)
+        valores = (np.outer(x, a) + b) % np.uint64(PRIMO)
+        con_shingles = np.flatnonzero(cantidades)
+        desplazamientos = np.concatenate(([0], np.cumsum(cantidades[con_shingles])[:-1]))
+        firmas[inicio + con_shingles] = np.minimum.reduceat(valores, desplazamientos, axis=0)
+    return firmas
+
+
+def _claves_banda(firmas, banda, filas):
+    clave = np.zeros(len(firmas), dtype=np.uint64)
+    for columna in firmas[:, banda * filas:(banda + 1) * filas].T:
+        clave = clave * MULTIPLICADOR + columna.astype(np.uint64)
+    return clave
+
+
+def indice_vacio(permutaciones=PERMUTACIONES, umbral=UMBRAL_INDICE, tamano_shingle=TAMANO_SHINGLE):
+    bandas, filas = _parametros_lsh(permutaciones, umbral)
+    return {
+        'parametros': {'permutaciones': permutaciones, 'bandas': bandas, 'filas': filas,
+                       'tamano_shingle': tamano_shingle},
+        'claves': np.zeros(0, dtype=np.uint64),
+        'usuarios': pd.Series([], dtype=str).astype('category'),
+        'firmas': np.zeros((0, permutaciones), dtype=np.uint32),
+        'cubetas': [(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)) for _ in range(bandas)],
+        'aristas': pd.DataFrame({'origen': np.zeros(0, np.int64), 'destino': np.zeros(0, np.int64),
+                                 'similitud': np.zeros(0, np.float32)}),
+    }
+
+
+@mt.instrumentar
+def actualizar_indice(indice, df):
+    # Añade comentarios nuevos: solo se calculan sus firmas y se buscan sus cubetas. Devuelve un índice
+    # nuevo sin tocar el recibido, que puede estar compartido entre sesiones (st.cache_resource).
+    indice = {**indice, 'cubetas': list(indice['cubetas'])}
+    p = indice['parametros']
+    # Las firmas son independientes por texto: se calculan por rangos contiguos en varios procesos.
+    calcular = functools.partial(firmas_minhash, permutaciones=p['permutaciones'], tamano_shingle=p['tamano_shingle'])
+    partes = pl.mapear(calcular, df['contenido_comentario'])
+    firmas = partes[0][1] if len(partes) == 1 else np.vstack([f for _, f in partes])
+    desplazamiento = len(indice['claves'])
+    filas_nuevas = np.arange(desplazamiento, desplazamiento + len(firmas))
+    indexables = (firmas != PRIMO).any(axis=1)
+    todas = np.vstack([indice['firmas'], firmas])
+
+    origenes, destinos = [], []
+    for banda, (claves_ordenadas, cabezas) in enumerate(indice['cubetas']):
+        claves = _claves_banda(firmas, banda, p['filas'])[indexables]
+        filas = filas_nuevas[indexables]
+
+        posiciones = np.searchsorted(claves_ordenadas, claves)
+        encontradas = posiciones < len(claves_ordenadas)
+        encontradas[encontradas] = claves_ordenadas[posiciones[encontradas]] == claves[encontradas]
+
+        unicas, primeras, inversas = np.unique(claves, return_index=True, return_inverse=True)
+        cabeza = filas[primeras][inversas]
+        cabeza[encontradas] = cabezas[posiciones[encontradas]]
+        origenes.append(filas)
+        destinos.append(cabeza)
+
+        nuevas = ~np.isin(unicas, claves_ordenadas[posiciones[encontradas]])
+        huecos = np.searchsorted(claves_ordenadas, unicas[nuevas])
+        indice['cubetas'][banda] = (np.insert(claves_ordenadas, huecos, unicas[nuevas]),
+                                    np.insert(cabezas, huecos, filas[primeras][nuevas]))
+
+    origen = np.concatenate(origenes) if origenes else np.zeros(0, dtype=np.int64)
+    destino = np.concatenate(destinos) if destinos else np.zeros(0, dtype=np.int64)
+    pares = pd.DataFrame({'origen': origen, 'destino': destino})
+    pares = pares[pares['origen'] != pares['destino']].drop_duplicates()
+    pares['similitud'] = (todas[pares['origen']] == todas[pares['destino']]).mean(axis=1).astype(np.float32)
+
+    indice['claves'] = np.concatenate([indice['claves'], np.asarray(df['clave'], dtype=np.uint64)])
+    indice['usuarios'] = pd.Series(union_categoricals(
+        [indice['usuarios'].astype('category'), df['usuario'].astype(str).astype('category')], ignore_order=True
+    ))
+    indice['firmas'] = todas
+    indice['aristas'] = pd.concat([indice['aristas'], pares], ignore_index=True)
+    return indice
+
+
+def construir_indice(df, **parametros):
+    return actualizar_indice(indice_vacio(**parametros), df)
+
+
+def _componentes(origen, destino):
+    nodos, inversos = np.unique(np.concatenate([origen, destino]), return_inverse=True)
+    origen, destino = inversos[:len(origen)], inversos[len(origen):]
+    etiquetas = np.arange(len(nodos))
+    while True:
+        menores = np.minimum(etiquetas[origen], etiquetas[destino])
+        nuevas = etiquetas.copy()
+        np.minimum.at(nuevas, origen, menores)
+        np.minimum.at(nuevas, destino, menores)
+        nuevas = nuevas[nuevas]
+        if np.array_equal(nuevas, etiquetas):
+            return nodos, etiquetas
+        etiquetas = nuevas
+
+
+@mt.instrumentar
+def grupos_similares(indice, umbral=0.8, claves=None, min_tamano=2):
+    aristas = indice['aristas'][indice['aristas']['similitud'] >= umbral]
+    columnas = ['grupo', 'tamano', 'autores', 'usuarios', 'clave_ejemplo']
+    if aristas.empty:
+        return pd.DataFrame(columns=columnas)
+
+    nodos, etiquetas = _componentes(aristas['origen'].to_numpy(), aristas['destino'].to_numpy())
+    miembros = pd.DataFrame({
+        'grupo': etiquetas,
+        'clave': indice['claves'][nodos],
+        'usuario': indice['usuarios'].to_numpy()[nodos]
+    })
+    if claves is not None:
+        miembros = miembros[np.isin(miembros['clave'].to_numpy(), np.asarray(claves, dtype=np.uint64))]
+
+    grupos = miembros.groupby('grupo').agg(
+        tamano=('clave', 'size'),
+        autores=('usuario', 'nunique'),
+        usuarios=('usuario', lambda u: sorted(set(u))),
+        clave_ejemplo=('clave', 'first')
+    ).reset_index()
+    grupos = grupos[grupos['tamano'] >= min_tamano]
+    return grupos.sort_values('tamano', ascending=False, kind='stable').reset_index(drop=True)[columnas]
+
+
+def guardar_indice(indice, destino):
+    datos = {
+        'claves': indice['claves'],
+        'firmas': indice['firmas'],
+        'aristas': indice['aristas'].to_records(index=False),
+        'parametros': np.array([indice['parametros'][k] for k in ('permutaciones', 'bandas', 'filas', 'tamano_shingle')]),
+    }
+    for banda, (claves, cabezas) in enumerate(indice['cubetas']):
+        datos[f'claves_{banda}'] = claves
+        datos[f'cabezas_{banda}'] = cabezas
+    with open(destino + '.npz.tmp', 'wb') as archivo:
+        np.savez(archivo, **datos)
+    pd.DataFrame({'usuario': indice['usuarios']}).to_parquet(destino + '.usuarios.parquet', index=False)
+    os.replace(destino + '.npz.tmp', destino + '.npz')
+
+
+def leer_indice(destino):
+    with np.load(destino + '.npz') as datos:
+        permutaciones, bandas, filas, tamano_shingle = (int(v) for v in datos['parametros'])
+        return {
+            'parametros': {'permutaciones': permutaciones, 'bandas': bandas, 'filas': filas,
+                           'tamano_shingle': tamano_shingle},
+            'claves': datos['claves'],
+            'usuarios': pd.read_parquet(destino + '.usuarios.parquet')['usuario'].astype('category'),
+            'firmas': datos['firmas'],
+            'cubetas': [(datos[f'claves_{b}'], datos[f'cabezas_{b}']) for b in range(bandas)],
+            'aristas': pd.DataFrame(datos['aristas']),
+        }
@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import html
+import json
+import os
+import re
+import time
+from urllib.parse import urlsplit
+import pandas as pd
+import Cache_Biblio as cache
+import Carga_Biblio as cl
+import Metricas_Biblio as mt
+
+# Descarga de comentarios por la API REST de WordPress del sitio. Requiere aiohttp, que es opcional.
+SITIO = os.environ.get('ECOCUBANO_SITIO', 'http://www.cubadebate.cu')
+API = '/wp-json/wp/v2'
+CONCURRENCIA = 4
+PETICIONES_POR_SEGUNDO = 2.0
+POR_PAGINA = 100
+PAGINAS_NOTICIAS = 1
+REINTENTOS = 3
+ESPERA_REINTENTO = 5.0
+TIEMPO_LIMITE = 60
+AGENTE = 'EcoCubano/1.0 (análisis de opinión pública; comentarios publicados)'
+ETIQUETAS = re.compile(r'<[^>]+>')
+
+
+class _Ritmo:
+    # Peticiones al mismo host separadas al menos 1/tasa segundos, sin importar cuántas tareas esperen.
+    def __init__(self, tasa):
+        self.intervalo = 1 / tasa if tasa else 0.0
+        self.turno = 0.0
+
+    async def esperar(self):
+        ahora = time.monotonic()
+        espera = self.turno - ahora
+        self.turno = max(ahora, self.turno) + self.intervalo
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+    def pausar(self, segundos):
+        # Retry-After: nadie vuelve a pedir a este host antes de que pase la pausa.
+        self.turno = max(self.turno, time.monotonic() + segundos)
+
+
+class _Cliente:
+    def __init__(self, sesion, sitio, tasa):
+        self.sesion = sesion
+        self.sitio = sitio.rstrip('/')
+        self.tasa = tasa
+        self.ritmos = {}
+        self.peticiones = 0
+        self.reintentos = 0
+        self.fallidas = 0
+
+    async def pedir(self, ruta, parametros, etiqueta=None):
+        # (estado, cuerpo, cabeceras); 304 si `etiqueta` sigue vigente. Reintenta 429 y errores del servidor.
+        import aiohttp
+        url = self.sitio + API + ruta
+        ritmo = self.ritmos.setdefault(urlsplit(url).netloc, _Ritmo(self.tasa))
+        cabeceras = {'If-None-Match': etiqueta} if etiqueta else {}
+        for intento in range(REINTENTOS + 1):
+            await ritmo.esperar()
+            self.peticiones += 1
+            try:
+                async with self.sesion.get(url, params=parametros, headers=cabeceras) as respuesta:
+                    if respuesta.status == 429 or respuesta.status >= 500:
+                        if intento == REINTENTOS:
+                            respuesta.raise_for_status()
+                        try:
+                            espera = float(respuesta.headers.get('Retry-After', ''))
+                        except ValueError:
+                            espera = ESPERA_REINTENTO * 2 ** intento
+                        ritmo.pausar(espera)
+                        self.reintentos += 1
+                        continue
+                    if respuesta.status == 304:
+                        return 304, None, respuesta.headers
+                    # WordPress responde 400 a una página fuera de rango: no hay más resultados.
+                    if respuesta.status == 400:
+                        return 400, [], respuesta.headers
+                    respuesta.raise_for_status()
+                    return respuesta.status, await respuesta.json(content_type=None), respuesta.headers
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if intento == REINTENTOS:
+                    raise
+                ritmo.pausar(ESPERA_REINTENTO * 2 ** intento)
+                self.reintentos += 1
+
+    async def paginas(self, ruta, parametros, maximo=None):
+        pagina, total = 1, 1
+        while pagina <= total and (maximo is None or pagina <= maximo):
+            _, cuerpo, cabeceras = await self.pedir(ruta, {**parametros, 'page': pagina})
+            yield cuerpo
+            total = int(cabeceras.get('X-WP-TotalPages', 1))
+            pagina += 1
+
+
+def _texto(valor):
+    if isinstance(valor, dict):
+        valor = valor.get('rendered', '')
+    return html.unescape(ETIQUETAS.sub('', valor or '')).strip()
+
+
+def _fecha(valor):
+    # La API da fecha y hora ISO; la exportación, y la clave de duplicados, solo el día (AAAA-MM-DD).
+    try:
+        return pd.Timestamp(valor).strftime('%Y-%m-%d') if valor else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _comentario(comentario):
+    return {
+        'autor': _texto(comentario.get('author_name')) or 'Anónimo',
+        'fecha': _fecha(comentario.get('date')),
+        'contenido': _texto(comentario.get('content')),
+    }
+
+
+async def _comentarios_nuevos(cliente, noticia, punto):
+    # Comentarios más recientes primero: se pide hasta encontrar el último ya descargado. La primera
+    # página se pide con el ETag guardado, así una noticia sin comentarios nuevos cuesta un 304.
+    ultimo = punto.get('ultimo_id', 0)
+    parametros = {'post': noticia['id'], 'per_page': POR_PAGINA, 'orderby': 'id', 'order': 'desc',
+                  '_fields': 'id,author_name,date,content'}
+    nuevos, etiqueta, pagina, total = {}, punto.get('etag'), 1, 1
+    while pagina <= total:
+        estado, cuerpo, cabeceras = await cliente.pedir('/comments', {**parametros, 'page': pagina},
+                                                        etiqueta if pagina == 1 else None)
+        if estado == 304:
+            return [], punto
+        if pagina == 1:
+            etiqueta = cabeceras.get('ETag')
+        # Por id: si llega un comentario mientras se pagina, el último de una página se repite en la siguiente.
+        recientes = [c for c in cuerpo if c['id'] > ultimo]
+        nuevos.update((c['id'], c) for c in recientes)
+        if len(recientes) < len(cuerpo):
+            break
+        total = int(cabeceras.get('X-WP-TotalPages', 1))
+        pagina += 1
+    punto = {'etag': etiqueta, 'ultimo_id': max([ultimo, *nuevos])}
+    return [nuevos[i] for i in sorted(nuevos)], punto
+
+
+async def extraer(sitio=SITIO, puntos=None, concurrencia=CONCURRENCIA, tasa=PETICIONES_POR_SEGUNDO,
+                  paginas_noticias=PAGINAS_NOTICIAS):
+    # Exportación con los comentarios nuevos de las noticias más recientes, los puntos de control
+    # actualizados y un resumen de la descarga.
+    import aiohttp
+    puntos = dict(puntos or {})
+    inicio = time.perf_counter()
+    # Un conector compartido reutiliza las conexiones y limita las simultáneas por host.
+    conector = aiohttp.TCPConnector(limit=concurrencia, limit_per_host=concurrencia)
+    tiempo = aiohttp.ClientTimeout(total=TIEMPO_LIMITE)
+    async with aiohttp.ClientSession(connector=conector, timeout=tiempo, headers={'User-Agent': AGENTE}) as sesion:
+        cliente = _Cliente(sesion, sitio, tasa)
+        categorias = {}
+        async for cuerpo in cliente.paginas('/categories', {'per_page': POR_PAGINA, '_fields': 'id,name'}):
+            categorias.update({c['id']: _texto(c['name']) for c in cuerpo})
+        noticias = []
+        async for cuerpo in cliente.paginas('/posts', {'per_page': POR_PAGINA, '_fields': 'id,title,categories'},
+                                            paginas_noticias):
+            noticias += cuerpo
+
+        turnos = asyncio.Semaphore(concurrencia)
+
+        async def descargar_noticia(noticia):
+            # Una noticia que sigue fallando tras los reintentos conserva su punto de control y se
+            # vuelve a pedir en la próxima descarga.
+            punto = puntos.get(str(noticia['id']), {})
+            async with turnos:
+                try:
+                    return await _comentarios_nuevos(cliente, noticia, punto)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    cliente.fallidas += 1
+                    return [], punto
+
+        resultados = await asyncio.gather(*[descargar_noticia(n) for n in noticias])
+
+    exportadas = []
+    for noticia, (comentarios, punto) in zip(noticias, resultados):
+        puntos[str(noticia['id'])] = punto
+        if comentarios:
+            exportadas.append({
+                'titulo_noticia': _texto(noticia.get('title')) or 'Sin título',
+                'categoria': categorias.get((noticia.get('categories') or [None])[0], ''),
+                'comentarios': [_comentario(c) for c in comentarios],
+            })
+    total = sum(len(n['comentarios']) for n in exportadas)
+    resumen = {
+        'noticias': len(noticias),
+        'noticias_con_nuevos': len(exportadas),
+        'comentarios': total,
+        'peticiones': cliente.peticiones,
+        'reintentos': cliente.reintentos,
+        'noticias_fallidas': cliente.fallidas,
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+    exportacion = {'analisis_comentarios': {'total_comentarios': total, 'comentarios': exportadas}}
+    return exportacion, puntos, resumen
+
+
+def ruta_puntos(destino=cl.RUTA_DATOS):
+    return destino + '.extraccion.json'
+
+
+def leer_puntos(ruta, sitio):
+    # Último comentario y ETag por noticia; los de otro sitio no sirven.
+    try:
+        with open(ruta, 'r', encoding='utf-8') as archivo:
+            guardados = json.load(archivo)
+    except (OSError, ValueError):
+        return {}
+    return guardados['noticias'] if guardados.get('sitio') == sitio else {}
+
+
+def guardar_puntos(ruta, sitio, puntos):
+    with open(ruta + '.tmp', 'w', encoding='utf-8') as archivo:
+        json.dump({'sitio': sitio, 'noticias': puntos}, archivo)
+    os.replace(ruta + '.tmp', ruta)
+
+
+def descargar(sitio=SITIO, destino=cl.RUTA_DATOS, concurrencia=CONCURRENCIA, tasa=PETICIONES_POR_SEGUNDO,
+              paginas_noticias=PAGINAS_NOTICIAS):
+    # Los comentarios nuevos se registran como anexo de `destino`, que las tablas en caché incorporan
+    # sin releer la exportación; si `destino` no existe, se escribe como exportación completa.
+    with mt.medir('descargar') as registro:
+        exportacion, puntos, resumen = asyncio.run(
+            extraer(sitio, leer_puntos(ruta_puntos(destino), sitio), concurrencia, tasa, paginas_noticias)
+        )
+        registro['filas'] = resumen['comentarios']
+        contenido = json.dumps(exportacion, ensure_ascii=False).encode('utf-8')
+        if not os.path.exists(destino):
+            with open(destino + '.tmp', 'wb') as archivo:
+                archivo.write(contenido)
+            os.replace(destino + '.tmp', destino)
+        elif resumen['comentarios']:
+            cache.registrar_anexo(contenido, destino)
+        # Los puntos de control se guardan después de los comentarios: si algo falla antes, la
+        # próxima descarga vuelve a pedirlos.
+        guardar_puntos(ruta_puntos(destino), sitio, puntos)
+    return resumen
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Descarga los comentarios nuevos de Cubadebate.")
+    parser.add_argument('--sitio', default=SITIO, help="Sitio WordPress, p. ej. la réplica de Replica_Biblio.py")
+    parser.add_argument('--datos', default=cl.RUTA_DATOS, help="Exportación a la que se añaden los comentarios")
+    parser.add_argument('--concurrencia', type=int, default=CONCURRENCIA, help="Conexiones simultáneas")
+    parser.add_argument('--peticiones-por-segundo', type=float, default=PETICIONES_POR_SEGUNDO,
+                        help="Ritmo máximo por host (0 = sin límite, solo para la réplica local)")
+    parser.add_argument('--paginas', type=int, default=PAGINAS_NOTICIAS,
+                        help=f"Páginas de {POR_PAGINA} noticias recientes a revisar")
+    args = parser.parse_args(argumentos)
+
+    resumen = descargar(args.sitio, args.datos, args.concurrencia, args.peticiones_por_segundo, args.paginas)
+    print(json.dumps(resumen, ensure_ascii=False, indent=2))
+    mt.exportar(aplicacion='Extraccion')
+
+
+if __name__ == '__main__':
+    main()
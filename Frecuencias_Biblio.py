@@ -0,0 +1,105 @@
+import re
+import numpy as np
+import pandas as pd
+import Cache_Biblio as cache
+import Cubo_Biblio as cb
+import Paralelo_Biblio as pl
+import Metricas_Biblio as mt
+
+PALABRAS_EXCLUIDAS = frozenset({
+    'yo', 'tú', 'él', 'ella', 'nosotros', 'vosotros', 'ellos', 'ellas', 'usted', 'ustedes',
+    'mi', 'tu', 'su', 'nuestro', 'vuestro', 'mío', 'tuyo', 'suyo',
+    'que', 'cual', 'quien', 'cuyo', 'cuanto', 'donde', 'cuando', 'como',
+    'y', 'o', 'pero', 'ni', 'si', 'aunque', 'porque',
+    'el', 'la', 'los', 'las', 'un', 'una', 'unos', 'unas',
+    'a', 'ante', 'bajo', 'cabe', 'con', 'contra', 'de', 'desde', 'en', 'entre',
+    'hacia', 'hasta', 'para', 'por', 'según', 'sin', 'so', 'sobre', 'tras',
+    'aquí', 'allí', 'ahora', 'antes', 'después', 'hoy', 'mañana', 'ayer',
+    'siempre', 'nunca', 'tarde', 'pronto', 'bien', 'mal', 'mejor', 'peor',
+    'muy', 'mucho', 'poco', 'bastante', 'demasiado', 'casi', 'todo', 'nada', 'también', 'además', 'tiene', 'tienen'
+})
+LONGITUD_MINIMA = 6
+TAMANO_BLOQUE = 50_000
+PALABRA = re.compile(r"\w[\w']{%d,}" % (LONGITUD_MINIMA - 1))
+CLAVES = ['fecha', 'categoria', 'termino']
+
+
+def _terminos(textos):
+    # Palabras de al menos LONGITUD_MINIMA letras que no están excluidas; el índice es la fila de origen.
+    terminos = textos.fillna('').astype(str).str.lower().str.findall(PALABRA).explode().dropna()
+    return terminos[~terminos.isin(PALABRAS_EXCLUIDAS)]
+
+
+def _plurales(conteo):
+    # Igual que WordCloud: "medidas" se suma a "medida" cuando ambas aparecen.
+    plurales = conteo.index[conteo.index.str.endswith('s') & conteo.index.str[:-1].isin(conteo.index)]
+    if len(plurales):
+        conteo = conteo.add(pd.Series(conteo[plurales].to_numpy(), index=plurales.str[:-1]), fill_value=0)
+        conteo = conteo.drop(plurales)
+    return conteo.astype(np.int64).sort_values(ascending=False, kind='stable')
+
+
+def contar_palabras(textos, tamano_bloque=TAMANO_BLOQUE):
+    # Frecuencias por bloques, sin unir todo el corpus en una sola cadena.
+    partes = [
+        _terminos(textos.iloc[inicio:inicio + tamano_bloque]).value_counts()
+        for inicio in range(0, len(textos), tamano_bloque)
+    ]
+    if not partes:
+        return pd.Series(dtype=np.int64, name='frecuencia')
+    return _plurales(pd.concat(partes).groupby(level=0).sum()).rename_axis('termino').rename('frecuencia')
+
+
+def _tabla(df, tamano_bloque=TAMANO_BLOQUE):
+    partes = []
+    for inicio in range(0, len(df), tamano_bloque):
+        bloque = df.iloc[inicio:inicio + tamano_bloque].reset_index(drop=True)
+        terminos = _terminos(bloque['contenido_comentario'])
+        filas = terminos.index.to_numpy()
+        partes.append(pd.DataFrame({
+            'fecha': bloque['fecha_comentario'].dt.normalize().take(filas).to_numpy(),
+            'categoria': bloque['categoria'].take(filas).reset_index(drop=True),
+            'termino': terminos.to_numpy(),
+        }))
+
+    if not partes:
+        partes = [pd.DataFrame({'fecha': pd.Series(dtype='datetime64[ns]'), 'categoria': df['categoria'][:0],
+                                'termino': pd.Series(dtype=str)})]
+    return _fusionar([t.assign(frecuencia=np.int32(1)) for t in partes])
+
+
+def _fusionar(tablas):
+    # Suma las frecuencias de tablas parciales; los términos se agrupan como texto para que el
+    # orden de filas no dependa de las categorías de cada parte.
+    tabla = cache.concatenar([t.assign(termino=t['termino'].astype(str)) for t in tablas])
+    tabla = tabla.groupby(CLAVES, observed=True, dropna=False)['frecuencia'].sum().reset_index()
+    tabla['termino'] = tabla['termino'].astype('category')
+    tabla['frecuencia'] = tabla['frecuencia'].astype(np.int32)
+    return tabla
+
+
+@mt.instrumentar
+def tabla_frecuencias(df, procesos=None):
+    return pl.agregar(_tabla, _fusionar, df, procesos, clave='dia')
+
+
+@mt.instrumentar
+def combinar(tabla, nuevos):
+    return _fusionar([tabla, tabla_frecuencias(nuevos)])
+
+
+@mt.instrumentar
+def frecuencias(tabla, categoria=None, rango_fechas=None):
+    # Una nube filtrada se arma sumando conteos ya guardados, no volviendo a leer los textos.
+    filas = tabla[cb.mascara(tabla, categoria, rango_fechas)]
+    conteo = filas.groupby('termino', observed=True)['frecuencia'].sum()
+    conteo.index = conteo.index.astype(str)
+    return _plurales(conteo[conteo > 0]).rename('frecuencia')
+
+
+def guardar_frecuencias(tabla, destino):
+    tabla.to_parquet(destino + '.parquet', index=False)
+
+
+def leer_frecuencias(destino):
+    return pd.read_parquet(destino + '.parquet')
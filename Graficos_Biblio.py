@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+# Puntos que se envían al navegador por serie temporal: más de lo que se distingue en pantalla y
+# poco para el JSON de la figura, sin importar cuántos días cubran los datos.
+PUNTOS_SERIE = 1_000
+
+
+def lttb(x, y, puntos=PUNTOS_SERIE):
+    # Largest-Triangle-Three-Buckets: posiciones de los puntos que conservan la forma de la serie.
+    # Se quedan el primero y el último, y de cada tramo el que forma el triángulo de más área con el
+    # elegido en el tramo anterior y la media del siguiente, así no se pierden los picos.
+    n = len(y)
+    if n <= puntos or puntos < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bordes = np.append(np.linspace(1, n - 1, puntos - 1).astype(np.int64), n)
+
+    elegidos = np.empty(puntos, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, n - 1
+    anterior = 0
+    for i in range(puntos - 2):
+        inicio, fin, siguiente = bordes[i], bordes[i + 1], bordes[i + 2]
+        cx, cy = x[fin:siguiente].mean(), y[fin:siguiente].mean()
+        areas = np.abs((x[anterior] - cx) * (y[inicio:fin] - y[anterior])
+                       - (x[anterior] - x[inicio:fin]) * (cy - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        elegidos[i + 1] = anterior
+    return elegidos
+
+
+def _eje(valores):
+    valores = pd.Index(valores)
+    if pd.api.types.is_numeric_dtype(valores):
+        return valores.to_numpy(np.float64)
+    return pd.to_datetime(valores).asi8.astype(np.float64)
+
+
+def reducir(tabla, columnas, x=None, puntos=PUNTOS_SERIE):
+    # Filas de `tabla` (ordenada por `x`, o por el índice si no se indica) que quedan tras reducir cada
+    # serie de `columnas` con LTTB; con varias series se conserva cualquier fila elegida por alguna.
+    if len(tabla) <= puntos:
+        return tabla
+    eje = _eje(tabla.index if x is None else tabla[x])
+    filas = np.unique(np.concatenate([lttb(eje, tabla[c].to_numpy(), puntos) for c in columnas]))
+    return tabla.iloc[filas]
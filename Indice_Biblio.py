@@ -0,0 +1,183 @@
+import functools
+import os
+import re
+import numpy as np
+import pandas as pd
+import Cache_Biblio as cache
+import Lexico_Biblio as lx
+import Metricas_Biblio as mt
+import Paralelo_Biblio as pl
+
+PALABRA = re.compile(r'\w+')
+TAMANO_BLOQUE = 100_000
+MAXIMO_SEGMENTOS = 8
+SEPARADOR = '\x00'
+
+
+def tokenizar(texto):
+    return PALABRA.findall(lx.normalizar(texto))
+
+
+def _rangos(inicios, fines):
+    # Concatena arange(inicio, fin) para cada par sin recorrerlos en Python.
+    longitudes = fines - inicios
+    desplazamientos = np.repeat(inicios - np.concatenate(([0], np.cumsum(longitudes)[:-1])), longitudes)
+    return desplazamientos + np.arange(longitudes.sum())
+
+
+def _segmento(vocabulario, codigos, filas, posiciones):
+    # Listas de apariciones ordenadas por término, fila y posición; `punteros` delimita cada término.
+    orden = np.lexsort((posiciones, filas, codigos))
+    punteros = np.concatenate(([0], np.cumsum(np.bincount(codigos, minlength=len(vocabulario)))))
+    return {
+        'vocabulario': np.asarray(vocabulario, dtype=object),
+        'punteros': punteros.astype(np.int64),
+        'filas': filas[orden].astype(np.int32),
+        'posiciones': posiciones[orden].astype(np.int32),
+    }
+
+
+def _segmento_textos(textos, desplazamiento):
+    tokens = lx.normalizar_textos(textos).str.findall(PALABRA)
+    cantidades = tokens.str.len().to_numpy()
+    filas = np.repeat(np.arange(desplazamiento, desplazamiento + len(tokens), dtype=np.int32), cantidades)
+    posiciones = np.arange(cantidades.sum()) - np.repeat(np.cumsum(cantidades) - cantidades, cantidades)
+    codigos, vocabulario = pd.factorize(tokens.explode().dropna().to_numpy(dtype=object), sort=True)
+    return _segmento(vocabulario, codigos, filas, posiciones)
+
+
+def _fusionar(segmentos):
+    vocabulario = np.unique(np.concatenate([s['vocabulario'] for s in segmentos]))
+    codigos = np.concatenate([
+        np.repeat(np.searchsorted(vocabulario, s['vocabulario']), np.diff(s['punteros']))
+        for s in segmentos
+    ])
+    filas = np.concatenate([s['filas'] for s in segmentos])
+    posiciones = np.concatenate([s['posiciones'] for s in segmentos])
+    return _segmento(vocabulario, codigos, filas, posiciones)
+
+
+def _indexar(textos, desplazamiento, tamano_bloque):
+    segmentos = [
+        _segmento_textos(textos.iloc[inicio:inicio + tamano_bloque], desplazamiento + inicio)
+        for inicio in range(0, len(textos), tamano_bloque)
+    ]
+    return _fusionar(segmentos) if segmentos else None
+
+
+def _indexar_fragmentos(textos, desplazamiento, tamano_bloque, procesos=None):
+    # Cada proceso indexa un rango contiguo de filas; al fusionar, sus filas se desplazan a la posición real.
+    partes = pl.mapear(functools.partial(_indexar, desplazamiento=0, tamano_bloque=tamano_bloque), textos, procesos)
+    segmentos = [s for _, s in partes if s is not None]
+    if len(segmentos) <= 1:
+        segmento = segmentos[0] if segmentos else None
+        if segmento is not None:
+            segmento['filas'] = segmento['filas'] + np.int32(desplazamiento)
+        return segmento
+    for (posiciones, segmento) in partes:
+        if segmento is not None:
+            segmento['filas'] = segmento['filas'] + np.int32(desplazamiento + posiciones[0])
+    return _fusionar(segmentos)
+
+
+@mt.instrumentar
+def combinar(indice, nuevos, tamano_bloque=TAMANO_BLOQUE, procesos=None):
+    # Los comentarios nuevos van en un segmento propio; cuando hay demasiados se fusionan todos.
+    segmento = _indexar_fragmentos(nuevos['contenido_comentario'], len(indice['dias']), tamano_bloque, procesos)
+    segmentos = indice['segmentos'] + ([segmento] if segmento is not None else [])
+    if len(segmentos) > MAXIMO_SEGMENTOS:
+        segmentos = [_fusionar(segmentos)]
+    return {'dias': np.concatenate([indice['dias'], np.asarray(nuevos['dia'], dtype=np.int32)]),
+            'segmentos': segmentos}
+
+
+def construir_indice(df, tamano_bloque=TAMANO_BLOQUE, procesos=None):
+    # Las filas del índice son las posiciones de los comentarios en la tabla de Cache_Biblio.
+    return combinar({'dias': np.zeros(0, dtype=np.int32), 'segmentos': []}, df, tamano_bloque, procesos)
+
+
+def _candidatos(segmento, token, modo):
+    vocabulario = segmento['vocabulario']
+    if modo == 'exacto':
+        posicion = np.searchsorted(vocabulario, token)
+        encontrado = posicion < len(vocabulario) and vocabulario[posicion] == token
+        return np.array([posicion] if encontrado else [], dtype=np.int64)
+    if modo == 'empieza':
+        return np.arange(np.searchsorted(vocabulario, token), np.searchsorted(vocabulario, token + '\U0010ffff'))
+
+    if 'serie' not in segmento:
+        try:
+            segmento['serie'] = pd.Series(vocabulario, dtype=pd.StringDtype('pyarrow'))
+        except ImportError:
+            segmento['serie'] = pd.Series(vocabulario, dtype=object)
+    serie = segmento['serie']
+    coincide = serie.str.endswith(token) if modo == 'termina' else serie.str.contains(token, regex=False)
+    return np.flatnonzero(coincide.to_numpy(dtype=bool))
+
+
+def _apariciones(segmento, token, modo):
+    ids = _candidatos(segmento, token, modo)
+    seleccion = _rangos(segmento['punteros'][ids], segmento['punteros'][ids + 1])
+    return segmento['filas'][seleccion], segmento['posiciones'][seleccion]
+
+
+def ocurrencias(indice, consulta):
+    # Fila de cada aparición de la consulta. Una palabra se busca dentro de los términos, como
+    # str.contains; una frase exige palabras consecutivas, cuyos extremos pueden ser parciales.
+    tokens = tokenizar(consulta)
+    resultados = [np.zeros(0, dtype=np.int64)]
+    if not tokens:
+        return resultados[0]
+
+    for segmento in indice['segmentos']:
+        if len(tokens) == 1:
+            resultados.append(_apariciones(segmento, tokens[0], 'contiene')[0].astype(np.int64))
+            continue
+        claves = None
+        for i, token in enumerate(tokens):
+            modo = 'termina' if i == 0 else 'empieza' if i == len(tokens) - 1 else 'exacto'
+            filas, posiciones = _apariciones(segmento, token, modo)
+            actuales = (filas.astype(np.int64) << 32) + posiciones - i
+            claves = actuales if claves is None else claves[np.isin(claves, actuales)]
+        resultados.append(claves >> 32)
+    return np.concatenate(resultados)
+
+
+@mt.instrumentar
+def buscar(indice, consulta):
+    return np.unique(ocurrencias(indice, consulta))
+
+
+def guardar_indice(indice, destino):
+    datos = {'dias': indice['dias'], 'segmentos': np.array(len(indice['segmentos']))}
+    for i, segmento in enumerate(indice['segmentos']):
+        datos[f'vocabulario_{i}'] = np.frombuffer(SEPARADOR.join(segmento['vocabulario']).encode('utf-8'), dtype=np.uint8)
+        for campo in ('punteros', 'filas', 'posiciones'):
+            datos[f'{campo}_{i}'] = segmento[campo]
+    with open(destino + '.npz.tmp', 'wb') as archivo:
+        np.savez(archivo, **datos)
+    os.replace(destino + '.npz.tmp', destino + '.npz')
+
+
+def leer_indice(destino):
+    with np.load(destino + '.npz') as datos:
+        segmentos = []
+        for i in range(int(datos['segmentos'])):
+            texto = datos[f'vocabulario_{i}'].tobytes().decode('utf-8')
+            segmentos.append({
+                'vocabulario': np.array(texto.split(SEPARADOR) if texto else [], dtype=object),
+                **{campo: datos[f'{campo}_{i}'] for campo in ('punteros', 'filas', 'posiciones')},
+            })
+        return {'dias': datos['dias'], 'segmentos': segmentos}
+
+
+def dias_con(indice, consulta, filas=None):
+    # Comentarios por día que contienen la consulta, opcionalmente solo entre `filas`.
+    encontradas = buscar(indice, consulta)
+    if filas is not None:
+        encontradas = encontradas[np.isin(encontradas, np.asarray(filas))]
+    dias = indice['dias'][encontradas]
+    dias = dias[dias != cache.SIN_DIA]
+    conteo = pd.Series(dias).value_counts().sort_index()
+    conteo.index = pd.to_datetime(conteo.index, unit='D')
+    return conteo
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import re
+import uuid
+from functools import lru_cache, partial
+import numpy as np
+import pandas as pd
+import Paralelo_Biblio as pl
+
+# Un archivo JSON por léxico: {"version": ..., "descripcion": ..., "terminos": [...]}.
+DIRECTORIO_LEXICOS = os.environ.get('ECOCUBANO_LEXICOS',
+                                    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicos'))
+# Mayúsculas y tildes no cuentan al buscar ("Revolucion" encuentra "revolución"); la ñ se conserva.
+ACENTOS = str.maketrans('áéíóúüàèìòùâêîôûäëïö', 'aeiouuaeiouaeiouaeio')
+SEPARADOR = '\x00'
+TAMANO_BLOQUE = 10_000
+MAXIMO_PARTES = 32
+# Léxicos de las clasificaciones de narrativa y emoción de cada comentario.
+NARRATIVA = ('narrativa_pro', 'narrativa_anti')
+EMOCION = ('emociones_positivas', 'emociones_negativas')
+
+_conteos = {}
+
+
+def normalizar(texto):
+    return str(texto).lower().translate(ACENTOS)
+
+
+def normalizar_textos(textos):
+    return textos.fillna('').astype(str).str.lower().str.translate(ACENTOS)
+
+
+def leer_lexicos(directorio=DIRECTORIO_LEXICOS):
+    # Términos y versión de cada léxico. La versión declarada sirve para el historial; el hash de los
+    # términos normalizados hace que una edición sin cambiarla también invalide los conteos guardados.
+    lexicos, versiones = {}, {}
+    for archivo in sorted(os.listdir(directorio)):
+        if not archivo.endswith('.json'):
+            continue
+        with open(os.path.join(directorio, archivo), 'r', encoding='utf-8') as entrada:
+            datos = json.load(entrada)
+        nombre = os.path.splitext(archivo)[0]
+        lexicos[nombre] = datos['terminos']
+        contenido = json.dumps([normalizar(t) for t in datos['terminos']], ensure_ascii=False)
+        versiones[nombre] = f"{datos['version']}-{hashlib.sha1(contenido.encode('utf-8')).hexdigest()[:8]}"
+    return lexicos, versiones
+
+
+LEXICOS, VERSIONES = leer_lexicos()
+
+
+def _patron_trie(terminos):
+    raiz = {}
+    for termino in terminos:
+        nodo = raiz
+        for caracter in termino:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[''] = True
+
+    def expresion(nodo):
+        final = '' in nodo
+        partes = [re.escape(c) + expresion(hijo) for c, hijo in sorted(nodo.items()) if c]
+        if not partes:
+            return ''
+        cuerpo = partes[0] if len(partes) == 1 and not final else '(?:' + '|'.join(partes) + ')'
+        return cuerpo + '?' if final else cuerpo
+
+    return expresion(raiz)
+
+
+class Lexico:
+    # Busca todos los términos de varios léxicos en una sola pasada por texto.
+    # El patrón es un trie compilado dentro de una búsqueda anticipada: en cada posición devuelve
+    # el término más largo que empieza ahí, y los términos que son prefijos suyos se deducen de
+    # una tabla precalculada, igual que las salidas de Aho–Corasick.
+    def __init__(self, lexicos):
+        self.lexicos = {nombre: [normalizar(t) for t in terminos] for nombre, terminos in lexicos.items()}
+        self.terminos = list(dict.fromkeys(t for terminos in self.lexicos.values() for t in terminos if t))
+        self.indices = {t: i for i, t in enumerate(self.terminos)}
+        self.longitudes = np.array([len(t) for t in self.terminos])
+        self.prefijos = [
+            [self.indices[p] for p in self.terminos if t.startswith(p)]
+            for t in self.terminos
+        ]
+        self.patron = re.compile(f'(?=({_patron_trie(self.terminos)}))') if self.terminos else None
+
+    def columnas(self, *nombres):
+        if not nombres:
+            return list(self.terminos)
+        return list(dict.fromkeys(t for nombre in nombres for t in self.lexicos[nombre] if t))
+
+    def _contar_bloque(self, textos):
+        # Conteo no solapado por término, como str.count.
+        longitudes = textos.str.len().to_numpy()
+        inicios = np.concatenate(([0], np.cumsum(longitudes + 1)[:-1]))
+        texto = SEPARADOR.join(textos.tolist())
+
+        posiciones, terminos = [], []
+        ultimo_fin = [-1] * len(self.terminos)
+        for coincidencia in self.patron.finditer(texto):
+            inicio = coincidencia.start()
+            for i in self.prefijos[self.indices[coincidencia.group(1)]]:
+                if inicio >= ultimo_fin[i]:
+                    ultimo_fin[i] = inicio + self.longitudes[i]
+                    posiciones.append(inicio)
+                    terminos.append(i)
+
+        filas = np.searchsorted(inicios, np.array(posiciones, dtype=np.int64), side='right') - 1
+        planos = filas * len(self.terminos) + np.array(terminos, dtype=np.int64)
+        conteos = np.bincount(planos, minlength=len(textos) * len(self.terminos))
+        return conteos.reshape(len(textos), len(self.terminos)).astype(np.int32)
+
+    def contar(self, textos, *nombres, tamano_bloque=TAMANO_BLOQUE):
+        textos = normalizar_textos(textos)
+        if self.patron is None or textos.empty:
+            conteos = np.zeros((len(textos), len(self.terminos)), dtype=np.int32)
+        else:
+            conteos = np.vstack([
+                self._contar_bloque(textos.iloc[i:i + tamano_bloque])
+                for i in range(0, len(textos), tamano_bloque)
+            ])
+        conteos = pd.DataFrame(conteos, index=textos.index, columns=self.terminos)
+        return conteos[self.columnas(*nombres)] if nombres else conteos
+
+
+@lru_cache(maxsize=64)
+def _lexico(nombres):
+    return Lexico({nombre: LEXICOS[nombre] for nombre in nombres})
+
+
+@lru_cache(maxsize=64)
+def _lexico_terminos(terminos):
+    return Lexico({'terminos': list(terminos)})
+
+
+def version(*nombres):
+    return '+'.join(f'{n}-{VERSIONES[n]}' for n in nombres)
+
+
+def columnas(nombre):
+    return list(dict.fromkeys(normalizar(t) for t in LEXICOS[nombre] if t))
+
+
+def escanear(textos, *nombres):
+    # Conteos sin pasar por los guardados, para quien ya guarda su propio resultado por texto.
+    return _lexico(tuple(nombres) or tuple(LEXICOS)).contar(textos)
+
+
+def _escanear(nombres, textos):
+    return _lexico(nombres).contar(textos)
+
+
+def _directorio(nombre):
+    import Cache_Biblio as cache
+    return os.path.join(cache.DIRECTORIO_CACHE, 'lexicos', version(nombre))
+
+
+def _guardados(nombre):
+    clave = version(nombre)
+    if clave not in _conteos:
+        try:
+            tabla = pd.read_parquet(_directorio(nombre))
+            tabla = tabla.drop_duplicates('hash').set_index('hash')[columnas(nombre)]
+        except (ImportError, OSError, ValueError, KeyError):
+            tabla = pd.DataFrame(0, index=pd.Index([], dtype=np.uint64, name='hash'), columns=columnas(nombre),
+                                 dtype=np.int16)
+        _conteos[clave] = tabla
+    return _conteos[clave]
+
+
+def _escribir_parte(directorio, tabla):
+    nombre = os.path.join(directorio, f'parte-{uuid.uuid4().hex}.parquet')
+    tabla.reset_index().to_parquet(nombre + '.tmp', index=False)
+    os.replace(nombre + '.tmp', nombre)
+
+
+def _guardar(nombre, nuevos):
+    clave = version(nombre)
+    _conteos[clave] = pd.concat([_conteos[clave], nuevos])
+    directorio = _directorio(nombre)
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        partes = [p for p in os.listdir(directorio) if p.endswith('.parquet')]
+        if len(partes) < MAXIMO_PARTES:
+            _escribir_parte(directorio, nuevos)
+            return
+        _escribir_parte(directorio, _conteos[clave])
+        for parte in partes:
+            os.remove(os.path.join(directorio, parte))
+    except (ImportError, OSError):
+        pass
+
+
+def contar(textos, *nombres):
+    # Conteos por término guardados por (versión del léxico, hash del comentario): cada comentario
+    # distinto se recorre una vez y, al editar un léxico, solo se vuelven a buscar sus términos.
+    nombres = tuple(dict.fromkeys(nombres)) or tuple(LEXICOS)
+    textos = textos.fillna('').astype(str)
+    hashes = pd.util.hash_array(textos.to_numpy(dtype=object))
+    unicos, primeros, inversos = np.unique(hashes, return_index=True, return_inverse=True)
+
+    faltantes = {n: _guardados(n).index.get_indexer(unicos) < 0 for n in nombres}
+    pendientes = tuple(n for n in nombres if faltantes[n].any())
+    if pendientes:
+        filas = np.flatnonzero(np.logical_or.reduce([faltantes[n] for n in pendientes]))
+        nuevos = pl.por_filas(partial(_escanear, pendientes), textos.iloc[primeros[filas]])
+        nuevos.index = pd.Index(unicos[filas], name='hash')
+        for n in pendientes:
+            _guardar(n, nuevos.loc[faltantes[n][filas], columnas(n)].astype(np.int16))
+
+    tabla = pd.concat([_guardados(n).reindex(unicos) for n in nombres], axis=1)
+    tabla = tabla.loc[:, ~tabla.columns.duplicated()]
+    return pd.DataFrame(tabla.to_numpy(np.int32)[inversos], index=textos.index, columns=tabla.columns)
+
+
+def sumar(conteos, nombre):
+    return conteos[columnas(nombre)].sum(axis=1)
+
+
+def contar_terminos(textos, terminos):
+    # Columnas con los términos tal como se pidieron, aunque se busquen sin tildes ni mayúsculas.
+    conteos = _lexico_terminos(tuple(terminos)).contar(textos)
+    return conteos[[normalizar(t) for t in terminos]].set_axis(list(terminos), axis=1)
@@ -0,0 +1,164 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import pandas as pd
+
+# Ruta donde exportar las métricas: *.prom en formato de texto de Prometheus, cualquier otra en JSON Lines.
+RUTA_METRICAS = os.environ.get('ECOCUBANO_METRICAS')
+# Mediciones que se conservan por hilo: fuera de Streamlit nadie llama a reiniciar() y un proceso
+# largo (Batch.py, una descarga programada) acumularía una por llamada. Los totales no se pierden.
+MAXIMO_REGISTROS = 10_000
+
+_estado = threading.local()
+_bloqueo = threading.Lock()
+_acumulado = {}
+
+
+def rss_actual():
+    try:
+        with open('/proc/self/statm') as archivo:
+            return int(archivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _registros():
+    # Streamlit ejecuta cada sesión en su propio hilo, así que cada una ve solo sus mediciones.
+    if not hasattr(_estado, 'registros'):
+        _estado.registros, _estado.pila = deque(maxlen=MAXIMO_REGISTROS), []
+    return _estado.registros
+
+
+def reiniciar():
+    _registros().clear()
+    _estado.pila.clear()
+
+
+@contextmanager
+def medir(nombre, filas=None, cache=None):
+    registros = _registros()
+    registro = {'funcion': nombre, 'nivel': len(_estado.pila), 'filas': filas, 'cache': cache}
+    _estado.pila.append(registro)
+    registros.append(registro)
+    memoria = rss_actual()
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    finally:
+        registro['segundos'] = time.perf_counter() - inicio
+        final = rss_actual()
+        registro['memoria_mb'] = (final - memoria) / 2**20 if memoria is not None and final is not None else None
+        _estado.pila.remove(registro)
+        _acumular(registro)
+
+
+def anotar(**valores):
+    # Completa la medición en curso, p. ej. anotar(cache='miss') dentro de una función cacheada.
+    _registros()
+    if _estado.pila:
+        _estado.pila[-1].update(valores)
+
+
+def _filas(valor):
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return len(valor)
+    return None
+
+
+def instrumentar(funcion):
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        with medir(funcion.__name__, _filas(args[0]) if args else None) as registro:
+            resultado = funcion(*args, **kwargs)
+            if registro['filas'] is None:
+                registro['filas'] = _filas(resultado)
+            return resultado
+    return envoltura
+
+
+def cachear(cache_data):
+    # Envuelve un decorador de caché como st.cache_data: el cuerpo solo corre en los fallos.
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def cuerpo(*args, **kwargs):
+            anotar(cache='miss')
+            return funcion(*args, **kwargs)
+        cacheada = cache_data(cuerpo)
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with medir(funcion.__name__, cache='hit') as registro:
+                resultado = cacheada(*args, **kwargs)
+                registro['filas'] = _filas(resultado)
+                return resultado
+        return envoltura
+    return decorador
+
+
+def _acumular(registro):
+    with _bloqueo:
+        total = _acumulado.setdefault(registro['funcion'], {'llamadas': 0, 'segundos': 0.0, 'filas': 0,
+                                                            'cache': {}})
+        total['llamadas'] += 1
+        total['segundos'] += registro['segundos']
+        total['filas'] += registro['filas'] or 0
+        if registro['cache']:
+            total['cache'][registro['cache']] = total['cache'].get(registro['cache'], 0) + 1
+
+
+def tabla(sangrada=False):
+    # En orden de inicio: cada función aparece antes que las que llama, con un nivel más.
+    columnas = ['funcion', 'nivel', 'segundos', 'filas', 'memoria_mb', 'cache']
+    tiempos = pd.DataFrame([r for r in _registros() if 'segundos' in r], columns=columnas)
+    tiempos['filas'] = tiempos['filas'].astype('Int64')
+    if sangrada:
+        tiempos['funcion'] = ['· ' * n + f for n, f in zip(tiempos['nivel'], tiempos['funcion'])]
+        tiempos = tiempos.drop(columns='nivel').round(3)
+    return tiempos
+
+
+def total():
+    return sum(r['segundos'] for r in _registros() if r['nivel'] == 0 and 'segundos' in r)
+
+
+def _prometheus():
+    lineas = []
+    metricas = [
+        ('ecocubano_llamadas_total', 'counter', 'Llamadas a cada función instrumentada', 'llamadas'),
+        ('ecocubano_segundos_total', 'counter', 'Tiempo acumulado de cada función', 'segundos'),
+        ('ecocubano_filas_total', 'counter', 'Filas procesadas por cada función', 'filas'),
+    ]
+    with _bloqueo:
+        acumulado = {funcion: {**valores, 'cache': dict(valores['cache'])} for funcion, valores in _acumulado.items()}
+    for nombre, tipo, ayuda, campo in metricas:
+        lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} {tipo}']
+        lineas += [f'{nombre}{{funcion="{f}"}} {v[campo]}' for f, v in sorted(acumulado.items())]
+    lineas += ['# HELP ecocubano_cache_total Aciertos (hit), fallos (miss) y actualizaciones parciales de caché',
+               '# TYPE ecocubano_cache_total counter']
+    for funcion, valores in sorted(acumulado.items()):
+        lineas += [f'ecocubano_cache_total{{funcion="{funcion}",resultado="{r}"}} {n}'
+                   for r, n in sorted(valores['cache'].items())]
+    return '\n'.join(lineas) + '\n'
+
+
+def exportar(ruta=None, aplicacion=None):
+    ruta = ruta or RUTA_METRICAS
+    if not ruta:
+        return
+    try:
+        if ruta.endswith('.prom'):
+            # Se escribe entero y se reemplaza, como espera el colector de archivos de texto.
+            with open(ruta + '.tmp', 'w', encoding='utf-8') as archivo:
+                archivo.write(_prometheus())
+            os.replace(ruta + '.tmp', ruta)
+        else:
+            registro = {'fecha': pd.Timestamp.now().isoformat(timespec='seconds'), 'aplicacion': aplicacion,
+                        'mediciones': tabla().to_dict(orient='records')}
+            with open(ruta, 'a', encoding='utf-8') as archivo:
+                archivo.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+    except OSError:
+        pass
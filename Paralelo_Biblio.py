@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+PROCESOS = int(os.environ['ECOCUBANO_PROCESOS']) if os.environ.get('ECOCUBANO_PROCESOS') else os.cpu_count() or 1
+MINIMO_FILAS = 50_000
+
+_compartido = {}
+
+
+def particionar(df, partes, clave=None):
+    # Posiciones de cada fragmento. Sin clave, rangos contiguos; con clave ("titulo_noticia", "dia"...),
+    # todas las filas con el mismo valor caen en el mismo fragmento.
+    if clave is None:
+        return [p for p in np.array_split(np.arange(len(df)), partes) if len(p)]
+    codigos, unicos = pd.factorize(df[clave], use_na_sentinel=False)
+    # Cortes por filas acumuladas para que los fragmentos tengan tamaños parecidos.
+    acumuladas = np.cumsum(np.bincount(codigos, minlength=len(unicos)))
+    fragmento = np.minimum(acumuladas * partes // max(len(df), 1), partes - 1)[codigos]
+    orden = np.argsort(fragmento, kind='stable')
+    cortes = np.searchsorted(fragmento[orden], np.arange(1, partes))
+    return [p for p in np.split(orden, cortes) if len(p)]
+
+
+def disponibles(procesos=None):
+    # Dentro de un proceso trabajador (p. ej. Batch.py) no se abre otro pool.
+    if multiprocessing.parent_process() is not None:
+        return 1
+    return PROCESOS if procesos is None else procesos
+
+
+def contexto():
+    # Desde el hilo principal, fork: los procesos heredan los datos sin copiarlos. Desde otro hilo (las
+    # sesiones de Streamlit) un fork puede heredar bloqueos tomados por los demás hilos, así que los
+    # procesos salen de un servidor limpio (forkserver) o de cero (spawn) y reciben los datos copiados.
+    metodos = multiprocessing.get_all_start_methods()
+    if 'fork' in metodos and threading.current_thread() is threading.main_thread():
+        return multiprocessing.get_context('fork')
+    if 'forkserver' not in metodos:
+        return multiprocessing.get_context('spawn')
+    # El servidor importa pandas una sola vez y los procesos nacen con él ya cargado.
+    servidor = multiprocessing.get_context('forkserver')
+    servidor.set_forkserver_preload([__name__])
+    return servidor
+
+
+def _procesos(filas, procesos):
+    return max(1, min(disponibles(procesos), filas // MINIMO_FILAS))
+
+
+def _ejecutar(funcion, posiciones):
+    return funcion(_compartido['datos'].iloc[posiciones])
+
+
+def _ejecutar_copia(funcion, fragmento):
+    return funcion(fragmento)
+
+
+def mapear(funcion, datos, procesos=None, clave=None):
+    # Aplica `funcion` a cada fragmento de `datos` (DataFrame o Series) y devuelve
+    # [(posiciones, resultado), ...]. Con fork los procesos heredan los datos sin copiarlos; `_compartido`
+    # solo se usa entonces, desde el hilo principal.
+    procesos = _procesos(len(datos), procesos)
+    fragmentos = particionar(datos, procesos, clave) if procesos > 1 else [np.arange(len(datos))]
+    if len(fragmentos) <= 1:
+        return [(p, funcion(datos.iloc[p] if len(p) < len(datos) else datos)) for p in fragmentos]
+
+    contexto_pool = contexto()
+    if contexto_pool.get_start_method() == 'fork':
+        _compartido['datos'] = datos
+        try:
+            with ProcessPoolExecutor(len(fragmentos), mp_context=contexto_pool) as pool:
+                resultados = list(pool.map(_ejecutar, [funcion] * len(fragmentos), fragmentos))
+        finally:
+            _compartido.clear()
+    else:
+        with ProcessPoolExecutor(len(fragmentos), mp_context=contexto_pool) as pool:
+            resultados = list(pool.map(_ejecutar_copia, [funcion] * len(fragmentos),
+                                       [datos.iloc[p] for p in fragmentos]))
+    return list(zip(fragmentos, resultados))
+
+
+def por_filas(funcion, datos, procesos=None):
+    # Para clasificadores fila a fila: el resultado queda en el mismo orden e índice que `datos`.
+    partes = mapear(funcion, datos, procesos)
+    if len(partes) == 1:
+        return partes[0][1]
+    resultado = pd.concat([r for _, r in partes])
+    return resultado.iloc[np.argsort(np.concatenate([p for p, _ in partes]), kind='stable')]
+
+
+def agregar(funcion, fusionar, datos, procesos=None, clave=None):
+    # Agregaciones parciales por fragmento que `fusionar` une en el mismo resultado que en un solo proceso.
+    partes = [r for _, r in mapear(funcion, datos, procesos, clave)]
+    return partes[0] if len(partes) == 1 else fusionar(partes)
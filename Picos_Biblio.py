@@ -0,0 +1,185 @@
+import json
+import os
+from collections import deque
+import numpy as np
+import pandas as pd
+import Cache_Biblio as cache
+import Metricas_Biblio as mt
+
+# mad: mediana y desviación absoluta mediana de los últimos VENTANA días; ewma: media y varianza
+# exponenciales con un alcance de VENTANA días.
+METODO = os.environ.get('ECOCUBANO_PICOS_METODO', 'mad')
+VENTANA = int(os.environ.get('ECOCUBANO_PICOS_VENTANA') or 28)
+UMBRAL = float(os.environ.get('ECOCUBANO_PICOS_UMBRAL') or 3.5)
+MINIMO_COMENTARIOS = 10
+MINIMO_DIAS = 7
+ESCALA_MAD = 1.4826
+TOP_NOTICIAS = 3
+
+
+def _parametros(metodo=METODO, ventana=VENTANA, umbral=UMBRAL, minimo=MINIMO_COMENTARIOS):
+    if metodo not in ('mad', 'ewma'):
+        raise ValueError(f"Método de detección desconocido: {metodo!r} (se esperaba 'mad' o 'ewma')")
+    return {'metodo': metodo, 'ventana': ventana, 'umbral': umbral, 'minimo': minimo}
+
+
+def _conteos(df):
+    # Comentarios por (día, noticia); las filas sin fecha no cuentan.
+    con_dia = df[df['dia'] != cache.SIN_DIA]
+    noticias = con_dia.groupby([con_dia['dia'], con_dia['titulo_noticia']], observed=True).size()
+    return noticias.rename('comentarios').reset_index()
+
+
+def _avanzar(parametros, comentarios, estado):
+    # Un paso del detector: referencia y varianza esperadas antes de ver el día, y el estado actualizado.
+    # `estado` es la ventana de días anteriores (mad) o el par (media, varianza) exponencial (ewma).
+    if parametros['metodo'] == 'mad':
+        previos = np.fromiter(estado, dtype=np.float64)
+        if len(previos):
+            base = float(np.median(previos))
+            varianza = (ESCALA_MAD * float(np.median(np.abs(previos - base)))) ** 2
+        else:
+            base, varianza = 0.0, 0.0
+        estado.append(comentarios)
+        return base, varianza, estado
+
+    alfa = 2 / (parametros['ventana'] + 1)
+    media, varianza = estado if estado is not None else (float(comentarios), 0.0)
+    diferencia = comentarios - media
+    incremento = alfa * diferencia
+    return media, varianza, (media + incremento, (1 - alfa) * (varianza + diferencia * incremento))
+
+
+def _puntuar(parametros, dias, comentarios, estado, observados):
+    filas = []
+    for dia, cantidad in zip(dias, comentarios):
+        base, varianza, estado = _avanzar(parametros, float(cantidad), estado)
+        # Con pocos comentarios la dispersión observada puede ser cero: se usa al menos la de Poisson.
+        escala = max(np.sqrt(varianza), np.sqrt(max(base, 1.0)))
+        puntuacion = (cantidad - base) / escala
+        pico = (observados >= MINIMO_DIAS and puntuacion >= parametros['umbral']
+                and cantidad >= parametros['minimo'])
+        filas.append((dia, cantidad, base, varianza, puntuacion, pico))
+        observados += 1
+    return pd.DataFrame(filas, columns=['dia', 'comentarios', 'base', 'varianza', 'puntuacion', 'pico']).astype(
+        {'dia': np.int32, 'comentarios': np.int64, 'base': np.float64, 'varianza': np.float64,
+         'puntuacion': np.float64, 'pico': bool})
+
+
+def _estado_en(detector, posicion):
+    # Estado del detector justo antes del día en `posicion` de la serie ya puntuada.
+    parametros, dias = detector['parametros'], detector['dias']
+    if parametros['metodo'] == 'mad':
+        previos = dias['comentarios'].iloc[max(0, posicion - parametros['ventana']):posicion]
+        return deque(previos.astype(np.float64), maxlen=parametros['ventana'])
+    if posicion == 0 or dias.empty:
+        return None
+    return float(dias['base'].iloc[posicion]), float(dias['varianza'].iloc[posicion])
+
+
+def _serie(noticias, desde, hasta):
+    # Comentarios por día entre `desde` y `hasta`, con ceros en los días sin actividad.
+    return noticias.groupby('dia')['comentarios'].sum().reindex(np.arange(desde, hasta + 1), fill_value=0)
+
+
+def detector_vacio(**parametros):
+    parametros = _parametros(**parametros)
+    return {
+        'parametros': parametros,
+        'dias': _puntuar(parametros, [], [], None, 0),
+        'noticias': pd.DataFrame({'dia': np.zeros(0, np.int32), 'titulo_noticia': pd.Categorical([]),
+                                  'comentarios': np.zeros(0, np.int64)}),
+    }
+
+
+@mt.instrumentar
+def combinar(detector, nuevos):
+    # Solo se vuelven a puntuar los días desde el primero que recibe comentarios; con anexos que
+    # traen los días más recientes, el coste es constante por día nuevo.
+    conteos = _conteos(nuevos)
+    if conteos.empty:
+        return detector
+
+    # Desde el último día puntuado como mínimo, para rellenar con ceros los días sin comentarios.
+    dias = detector['dias']
+    primero = int(conteos['dia'].min())
+    if not dias.empty:
+        primero = min(primero, int(dias['dia'].iloc[-1]))
+    inicio = int(np.searchsorted(dias['dia'].to_numpy(), primero))
+
+    # Las filas están ordenadas por día: solo se reagrupan las de los días afectados.
+    anteriores = detector['noticias']
+    corte = int(np.searchsorted(anteriores['dia'].to_numpy(), primero))
+    cola = cache.concatenar([anteriores.iloc[corte:], conteos])
+    cola = cola.groupby(['dia', 'titulo_noticia'], observed=True)['comentarios'].sum().reset_index()
+    noticias = cache.concatenar([anteriores.iloc[:corte], cola])
+
+    serie = _serie(cola, primero, int(cola['dia'].max()))
+    estado = _estado_en(detector, inicio)
+    puntuados = _puntuar(detector['parametros'], serie.index, serie.to_numpy(), estado, inicio)
+    return {
+        'parametros': detector['parametros'],
+        'dias': pd.concat([dias.iloc[:inicio], puntuados], ignore_index=True),
+        'noticias': noticias,
+    }
+
+
+def construir_detector(df, **parametros):
+    return combinar(detector_vacio(**parametros), df)
+
+
+def actividad(detector):
+    # Serie diaria completa: comentarios, valor esperado, puntuación y si el día es un pico.
+    dias = detector['dias']
+    return pd.DataFrame({
+        'fecha': pd.to_datetime(dias['dia'].to_numpy(), unit='D'),
+        'conteo': dias['comentarios'].to_numpy(),
+        'esperado': dias['base'].round(1).to_numpy(),
+        'puntuacion': dias['puntuacion'].round(2).to_numpy(),
+        'pico': dias['pico'].to_numpy(),
+    })
+
+
+def picos(detector, desde=None):
+    # Picos detectados, opcionalmente solo a partir de una fecha (p. ej. para alertas recientes).
+    tabla = actividad(detector)
+    tabla = tabla[tabla['pico']]
+    if desde is not None:
+        tabla = tabla[tabla['fecha'] >= pd.Timestamp(desde)]
+    return tabla.drop(columns='pico').reset_index(drop=True)
+
+
+def noticias_pico(detector, fechas, top_n=TOP_NOTICIAS):
+    # Noticias que más comentarios aportaron en cada fecha, con su proporción del total del día.
+    dias = [cache.dia_ordinal(f) for f in fechas]
+    noticias = detector['noticias'][detector['noticias']['dia'].isin(dias)]
+    total = noticias.groupby('dia')['comentarios'].transform('sum')
+    noticias = noticias.assign(proporcion=noticias['comentarios'] / total)
+    noticias = noticias.sort_values(['dia', 'comentarios'], ascending=[True, False], kind='stable')
+    noticias = noticias.groupby('dia').head(top_n)
+    return pd.DataFrame({
+        'fecha': pd.to_datetime(noticias['dia'].to_numpy(), unit='D'),
+        'titulo_noticia': noticias['titulo_noticia'].astype(str).to_numpy(),
+        'comentarios': noticias['comentarios'].to_numpy(),
+        'proporcion': noticias['proporcion'].round(3).to_numpy(),
+    })
+
+
+def guardar_detector(detector, destino):
+    detector['dias'].to_parquet(destino + '.dias.parquet', index=False)
+    detector['noticias'].to_parquet(destino + '.noticias.parquet', index=False)
+    with open(destino + '.parametros.json', 'w', encoding='utf-8') as archivo:
+        json.dump(detector['parametros'], archivo)
+
+
+def leer_detector(destino, **parametros):
+    # Un detector guardado con otros parámetros no sirve: el ValueError hace que se reconstruya.
+    with open(destino + '.parametros.json', 'r', encoding='utf-8') as archivo:
+        guardados = json.load(archivo)
+    if guardados != _parametros(**parametros):
+        raise ValueError(f"Detector guardado con otros parámetros: {guardados}")
+    return {
+        'parametros': guardados,
+        'dias': pd.read_parquet(destino + '.dias.parquet'),
+        'noticias': pd.read_parquet(destino + '.noticias.parquet'),
+    }
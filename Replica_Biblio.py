@@ -0,0 +1,154 @@
+import argparse
+import hashlib
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+import Carga_Biblio as cl
+
+# Réplica local de la API REST de WordPress de Cubadebate (posts, categories, comments) servida a
+# partir de una exportación: permite probar y medir Extraccion_Biblio.py sin salir a internet.
+PUERTO = 8000
+POR_PAGINA_MAXIMO = 100
+
+
+class Replica:
+    # Noticias y comentarios con identificadores como los del sitio: crecientes, más recientes al final.
+    def __init__(self):
+        self.categorias = {}
+        self.noticias = []
+        self.comentarios = {}
+        self.siguiente_comentario = 1
+        self.bloqueo = threading.Lock()
+
+    def _fecha(self, fecha, identificador):
+        # WordPress publica fecha y hora ("2024-07-29T14:03:00"); la hora sale del id para que varíe.
+        try:
+            dia = pd.Timestamp(fecha).normalize()
+        except (TypeError, ValueError):
+            return ''
+        return (dia + pd.Timedelta(seconds=identificador * 7919 % 86_400)).strftime('%Y-%m-%dT%H:%M:%S')
+
+    def _categoria(self, nombre):
+        if nombre not in self.categorias:
+            self.categorias[nombre] = len(self.categorias) + 1
+        return self.categorias[nombre]
+
+    def agregar(self, noticias):
+        # Noticias de una exportación; un título ya publicado recibe los comentarios como nuevos.
+        with self.bloqueo:
+            titulos = {n['titulo']: n for n in self.noticias}
+            for noticia in noticias:
+                titulo = noticia.get('titulo_noticia', 'Sin título')
+                if titulo not in titulos:
+                    titulos[titulo] = {'id': len(self.noticias) + 1, 'titulo': titulo,
+                                       'categoria': self._categoria(noticia.get('categoria', ''))}
+                    self.noticias.append(titulos[titulo])
+                    self.comentarios[titulos[titulo]['id']] = []
+                lista = self.comentarios[titulos[titulo]['id']]
+                for comentario in noticia.get('comentarios') or []:
+                    lista.append({
+                        'id': self.siguiente_comentario,
+                        'post': titulos[titulo]['id'],
+                        'author_name': comentario.get('autor', 'Anónimo'),
+                        'date': self._fecha(comentario.get('fecha'), self.siguiente_comentario),
+                        'content': {'rendered': '<p>%s</p>' % (comentario.get('contenido') or '')},
+                    })
+                    self.siguiente_comentario += 1
+
+    def cargar(self, ruta):
+        with open(ruta, 'r', encoding='utf-8') as archivo:
+            self.agregar(cl.iterar_noticias(archivo))
+        return self
+
+    def _pagina(self, elementos, consulta):
+        por_pagina = min(int(consulta.get('per_page', 10)), POR_PAGINA_MAXIMO)
+        pagina = int(consulta.get('page', 1))
+        total_paginas = max(math.ceil(len(elementos) / por_pagina), 1)
+        if pagina > total_paginas:
+            return 400, {'code': 'rest_post_invalid_page_number'}, {}
+        cabeceras = {'X-WP-Total': str(len(elementos)), 'X-WP-TotalPages': str(total_paginas)}
+        return 200, elementos[(pagina - 1) * por_pagina:pagina * por_pagina], cabeceras
+
+    def responder(self, ruta, consulta):
+        with self.bloqueo:
+            if ruta == '/wp-json/wp/v2/categories':
+                categorias = [{'id': i, 'name': n, 'slug': n.lower()} for n, i in self.categorias.items()]
+                return self._pagina(categorias, consulta)
+            if ruta == '/wp-json/wp/v2/posts':
+                # Como en WordPress, de la más reciente a la más antigua.
+                noticias = [{'id': n['id'], 'title': {'rendered': n['titulo']}, 'categories': [n['categoria']]}
+                            for n in reversed(self.noticias)]
+                return self._pagina(noticias, consulta)
+            if ruta == '/wp-json/wp/v2/comments':
+                comentarios = self.comentarios.get(int(consulta.get('post', 0)), [])
+                if consulta.get('order', 'desc') == 'desc':
+                    comentarios = comentarios[::-1]
+                return self._pagina(comentarios, consulta)
+        return 404, {'code': 'rest_no_route'}, {}
+
+
+def _manejador(replica, latencia):
+    class Manejador(BaseHTTPRequestHandler):
+        # HTTP/1.1 para que el cliente pueda reutilizar las conexiones.
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            partes = urlsplit(self.path)
+            consulta = {k: v[0] for k, v in parse_qs(partes.query).items()}
+            estado, cuerpo, cabeceras = replica.responder(partes.path, consulta)
+            contenido = json.dumps(cuerpo, ensure_ascii=False).encode('utf-8')
+            etiqueta = '"%s"' % hashlib.sha1(contenido).hexdigest()
+            if latencia:
+                time.sleep(latencia)
+            if estado == 200 and self.headers.get('If-None-Match') == etiqueta:
+                estado, contenido = 304, b''
+
+            self.send_response(estado)
+            self.send_header('Content-Type', 'application/json; charset=UTF-8')
+            self.send_header('Content-Length', str(len(contenido)))
+            if estado in (200, 304):
+                self.send_header('ETag', etiqueta)
+            for clave, valor in cabeceras.items():
+                self.send_header(clave, valor)
+            self.end_headers()
+            self.wfile.write(contenido)
+
+        def log_message(self, *args):
+            pass
+
+    return Manejador
+
+
+def servir(replica, puerto=PUERTO, latencia=0.0):
+    # Devuelve el servidor ya escuchando en un hilo; `puerto=0` elige uno libre (servidor.server_port).
+    servidor = ThreadingHTTPServer(('127.0.0.1', puerto), _manejador(replica, latencia))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Sirve una exportación como la API de comentarios de Cubadebate.")
+    parser.add_argument('exportaciones', nargs='+', help="Exportaciones JSON con el esquema de Cubadebate")
+    parser.add_argument('--puerto', type=int, default=PUERTO)
+    parser.add_argument('--latencia', type=float, default=0.0, help="Segundos de espera por respuesta")
+    args = parser.parse_args(argumentos)
+
+    replica = Replica()
+    for ruta in args.exportaciones:
+        replica.cargar(ruta)
+    servidor = servir(replica, args.puerto, args.latencia)
+    print(f"Réplica en http://127.0.0.1:{servidor.server_port} "
+          f"({len(replica.noticias)} noticias, {replica.siguiente_comentario - 1} comentarios)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+import pandas as pd
+import Cache_Biblio as cache
+import Lexico_Biblio as lx
+import Metricas_Biblio as mt
+import Paralelo_Biblio as pl
+
+DIRECTORIO_PUNTUACIONES = os.path.join(cache.DIRECTORIO_CACHE, 'sentimiento')
+TAMANO_LOTE = 5_000
+MAXIMO_PARTES = 32
+ETIQUETAS = np.array(['Negativo', 'Neutral', 'Positivo'])
+ETIQUETAS_EMOCION = np.array(['negativo', 'neutral', 'positivo'])
+# "textblob", "lexico", "sklearn:<modelo.joblib>" u "onnx:<modelo.onnx>", según el despliegue.
+MODELO = os.environ.get('ECOCUBANO_SENTIMIENTO', 'textblob')
+
+_puntuaciones = {}
+_modelos = {}
+
+
+def hash_textos(textos):
+    return pd.util.hash_array(textos.to_numpy(dtype=object))
+
+
+def _signo_clase(clase):
+    # Convierte la etiqueta de un clasificador en -1, 0 o 1 (p. ej. "negativo", "POS", -1).
+    try:
+        return float(np.sign(float(clase)))
+    except (TypeError, ValueError):
+        texto = str(clase).lower()
+        return 1.0 if texto.startswith('pos') else -1.0 if texto.startswith('neg') else 0.0
+
+
+def _polaridad_probabilidades(probabilidades, clases):
+    # Probabilidad de la clase positiva menos la de la negativa, en [-1, 1].
+    return np.asarray(probabilidades, dtype='float64') @ np.array([_signo_clase(c) for c in clases])
+
+
+def _puntuar_textblob(textos):
+    from textblob import TextBlob
+    return [TextBlob(texto).sentiment.polarity if texto.strip() else 0.0 for texto in textos]
+
+
+def _puntuar_lexico(textos):
+    conteos = lx.escanear(pd.Series(textos, dtype=object), 'emociones_positivas', 'emociones_negativas')
+    positivas = lx.sumar(conteos, 'emociones_positivas').to_numpy()
+    negativas = lx.sumar(conteos, 'emociones_negativas').to_numpy()
+    return ((positivas - negativas) / np.maximum(positivas + negativas, 1)).tolist()
+
+
+def _puntuar_sklearn(textos, ruta):
+    if ruta not in _modelos:
+        import joblib
+        _modelos[ruta] = joblib.load(ruta)
+    modelo = _modelos[ruta]
+    if hasattr(modelo, 'predict_proba'):
+        return _polaridad_probabilidades(modelo.predict_proba(textos), modelo.classes_).tolist()
+    return [_signo_clase(c) for c in modelo.predict(textos)]
+
+
+def _puntuar_onnx(textos, ruta):
+    if ruta not in _modelos:
+        import onnxruntime
+        _modelos[ruta] = onnxruntime.InferenceSession(ruta, providers=['CPUExecutionProvider'])
+    sesion = _modelos[ruta]
+    entrada = sesion.get_inputs()[0]
+    forma = [len(textos), 1] if len(entrada.shape) == 2 else [len(textos)]
+    etiquetas, probabilidades = sesion.run(None, {entrada.name: np.array(textos, dtype=object).reshape(forma)})[:2]
+    # Los clasificadores exportados con skl2onnx devuelven una lista de {clase: probabilidad}.
+    if isinstance(probabilidades, list):
+        clases = list(probabilidades[0]) if probabilidades else []
+        return _polaridad_probabilidades([[p[c] for c in clases] for p in probabilidades], clases).tolist()
+    clases = sesion.get_modelmeta().custom_metadata_map.get('clases')
+    if clases:
+        return _polaridad_probabilidades(probabilidades, clases.split(',')).tolist()
+    return [_signo_clase(c) for c in np.ravel(etiquetas)]
+
+
+MODELOS = {
+    'textblob': _puntuar_textblob,
+    'lexico': _puntuar_lexico,
+    'sklearn': _puntuar_sklearn,
+    'onnx': _puntuar_onnx,
+}
+
+
+def _especificacion(modelo):
+    tipo, _, ruta = (modelo or MODELO).partition(':')
+    if tipo not in MODELOS:
+        raise ValueError(f"Modelo de sentimiento desconocido: {tipo}")
+    if tipo in ('sklearn', 'onnx') and not ruta:
+        raise ValueError(f"El modelo {tipo} necesita la ruta del archivo: {tipo}:<ruta>")
+    return tipo, ruta
+
+
+def _identificador(tipo, ruta):
+    # Las puntuaciones se guardan por modelo; si el archivo del modelo o sus léxicos cambian, se vuelven a calcular.
+    if tipo == 'lexico':
+        return f"{tipo}-{lx.version('emociones_positivas', 'emociones_negativas')}"
+    return f'{tipo}-{cache.hash_archivo(ruta)[:12]}' if ruta else tipo
+
+
+def version(modelo=None):
+    # Modelo con su archivo o sus léxicos: los resultados guardados que dependen de él lo usan de clave.
+    return _identificador(*_especificacion(modelo))
+
+
+def puntuar_lote(textos, modelo=None):
+    tipo, ruta = _especificacion(modelo)
+    return MODELOS[tipo](textos, ruta) if ruta else MODELOS[tipo](textos)
+
+
+def _puntuar(textos, modelo, procesos=None, tamano_lote=TAMANO_LOTE):
+    # Cada proceso carga el modelo una sola vez y lo reutiliza para todos sus lotes.
+    lotes = [textos[i:i + tamano_lote] for i in range(0, len(textos), tamano_lote)]
+    procesos = pl.disponibles(procesos)
+    if len(lotes) <= 1 or procesos == 1:
+        return [p for lote in lotes for p in puntuar_lote(lote, modelo)]
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=pl.contexto()) as pool:
+        return [p for resultado in pool.map(puntuar_lote, lotes, repeat(modelo)) for p in resultado]
+
+
+def _leer_puntuaciones(directorio):
+    try:
+        tabla = pd.read_parquet(directorio)
+    except (ImportError, OSError, ValueError):
+        return pd.Series(dtype='float64')
+    return tabla.drop_duplicates('hash').set_index('hash')['polaridad']
+
+
+def _guardar_puntuaciones(nuevas, identificador):
+    directorio = os.path.join(DIRECTORIO_PUNTUACIONES, identificador)
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        partes = [p for p in os.listdir(directorio) if p.endswith('.parquet')]
+        if len(partes) >= MAXIMO_PARTES:
+            _compactar(directorio, partes, _puntuaciones[identificador])
+        nombre = os.path.join(directorio, f'parte-{uuid.uuid4().hex}.parquet')
+        nuevas.rename_axis('hash').reset_index().to_parquet(nombre + '.tmp', index=False)
+        os.replace(nombre + '.tmp', nombre)
+    except (ImportError, OSError):
+        pass
+
+
+def _compactar(directorio, partes, puntuaciones):
+    nombre = os.path.join(directorio, f'parte-{uuid.uuid4().hex}.parquet')
+    puntuaciones.rename_axis('hash').reset_index().to_parquet(nombre + '.tmp', index=False)
+    os.replace(nombre + '.tmp', nombre)
+    for parte in partes:
+        os.remove(os.path.join(directorio, parte))
+
+
+@mt.instrumentar
+def polaridades(textos, procesos=None, tamano_lote=TAMANO_LOTE, modelo=None):
+    tipo, ruta = _especificacion(modelo)
+    identificador = _identificador(tipo, ruta)
+    if identificador not in _puntuaciones:
+        _puntuaciones[identificador] = _leer_puntuaciones(os.path.join(DIRECTORIO_PUNTUACIONES, identificador))
+
+    textos = textos.fillna('').astype(str)
+    hashes = hash_textos(textos)
+    unicos, primeros, inversos = np.unique(hashes, return_index=True, return_inverse=True)
+    valores = _puntuaciones[identificador].reindex(unicos).to_numpy(dtype='float64', copy=True)
+
+    faltantes = np.flatnonzero(np.isnan(valores))
+    mt.anotar(cache='hit' if not len(faltantes) else 'miss' if len(faltantes) == len(valores) else 'parcial')
+    if len(faltantes):
+        nuevos = textos.iloc[primeros[faltantes]].tolist()
+        valores[faltantes] = _puntuar(nuevos, f'{tipo}:{ruta}' if ruta else tipo, procesos, tamano_lote)
+        nuevas = pd.Series(valores[faltantes], index=unicos[faltantes], name='polaridad')
+        _puntuaciones[identificador] = pd.concat([_puntuaciones[identificador], nuevas])
+        _guardar_puntuaciones(nuevas, identificador)
+
+    return pd.Series(valores[inversos], index=textos.index, name='sentimiento')
+
+
+def categorizar(polaridades):
+    indices = np.sign(polaridades.to_numpy()).astype(int) + 1
+    return pd.Series(pd.Categorical(ETIQUETAS[indices], categories=ETIQUETAS),
+                     index=polaridades.index, name='sentimiento_categoria')
+
+
+def emociones(textos, modelo='lexico', procesos=None):
+    # Con "lexico" coincide con Story_Biblio.analizar_emociones_textos; otro modelo da la misma escala.
+    indices = np.sign(polaridades(textos, procesos, modelo=modelo).to_numpy()).astype(int) + 1
+    return pd.Series(ETIQUETAS_EMOCION[indices], index=textos.index, name='emocion')
@@ -0,0 +1,99 @@
+import argparse
+import json
+import numpy as np
+import pandas as pd
+import Lexico_Biblio as lx
+
+CATEGORIAS = ['politica', 'economia', 'salud', 'deportes', 'cultura', 'ciencia', 'internacionales']
+VOCABULARIO = (
+    'el la los las de del que y en a un una por para con no se su al lo como más pero sus le ya o este '
+    'gobierno pueblo cuba país economía precios salario trabajo medidas apagones corriente transporte '
+    'mercado dólar escasez comida medicamentos hospital escuela jóvenes familia provincia municipio '
+    'habana santiago ministro directivos empresa producción agricultura turismo inversión remesas '
+    'emigración visado frontera noticia artículo información periodista pregunta respuesta opinión '
+    'gracias excelente apoyo fuerte vencer bloqueo revolución patria imperialismo corrupción protesta '
+    'crisis ineficiencia injusto alegria tristeza enojo sorpresa miedo violencia destruir atacar'
+).split()
+CONSIGNAS = [c for nombre in ('consignas_pro', 'consignas_anti') for c in lx.LEXICOS[nombre]]
+COMENTARIOS_POR_NOTICIA = 60
+NOTICIAS_POR_BLOQUE = 500
+
+
+def _textos(aleatorio, cantidad, campanas):
+    # Palabras con distribución de Zipf, algunas consignas y un porcentaje de textos copiados con cambios.
+    pesos = 1 / np.arange(1, len(VOCABULARIO) + 1)
+    palabras = np.array(VOCABULARIO, dtype=object)
+    longitudes = aleatorio.integers(3, 60, cantidad)
+    indices = aleatorio.choice(len(VOCABULARIO), longitudes.sum(), p=pesos / pesos.sum())
+    cortes = np.cumsum(longitudes)[:-1]
+    textos = [' '.join(fragmento) for fragmento in np.split(palabras[indices], cortes)]
+
+    for i in np.flatnonzero(aleatorio.random(cantidad) < 0.02):
+        textos[i] += ' ' + CONSIGNAS[aleatorio.integers(len(CONSIGNAS))]
+    for i in np.flatnonzero(aleatorio.random(cantidad) < 0.03):
+        base = campanas[aleatorio.integers(len(campanas))].split()
+        base[aleatorio.integers(len(base))] = VOCABULARIO[aleatorio.integers(len(VOCABULARIO))]
+        textos[i] = ' '.join(base)
+    return textos
+
+
+def generar_exportacion(ruta, comentarios, semilla=0, comentarios_por_noticia=COMENTARIOS_POR_NOTICIA,
+                        inicio='2023-01-01', dias=730, usuarios=None):
+    # Escribe el JSON por noticias, sin tener la exportación completa en memoria.
+    aleatorio = np.random.default_rng(semilla)
+    usuarios = usuarios or max(comentarios // 20, 10)
+    inicio = pd.Timestamp(inicio)
+    campanas = [' '.join(aleatorio.choice(VOCABULARIO, 25)) for _ in range(20)]
+    # Comentarios por noticia de Poisson, recortando la última para llegar al total exacto.
+    cantidades = aleatorio.poisson(comentarios_por_noticia, comentarios // comentarios_por_noticia + 10) + 1
+    while cantidades.sum() < comentarios:
+        cantidades = np.concatenate([cantidades, aleatorio.poisson(comentarios_por_noticia, 10) + 1])
+    acumulado = np.cumsum(cantidades)
+    noticias = int(np.searchsorted(acumulado, comentarios)) + 1
+    cantidades = cantidades[:noticias]
+    cantidades[-1] -= acumulado[noticias - 1] - comentarios
+
+    with open(ruta, 'w', encoding='utf-8') as archivo:
+        archivo.write('{"analisis_comentarios": {"total_comentarios": %d, "comentarios": [' % comentarios)
+        for primera in range(0, noticias, NOTICIAS_POR_BLOQUE):
+            bloque = cantidades[primera:primera + NOTICIAS_POR_BLOQUE]
+            total = int(bloque.sum())
+
+            textos = _textos(aleatorio, total, campanas)
+            autores = np.minimum(aleatorio.zipf(1.3, total), usuarios)
+            publicacion = aleatorio.integers(0, dias, len(bloque))
+            retraso = np.minimum(aleatorio.exponential(1.5, total).astype(int), 30)
+            fechas = (inicio + pd.to_timedelta(np.repeat(publicacion, bloque) + retraso, unit='D'))
+            fechas = fechas.strftime('%Y-%m-%d').tolist()
+            for i in np.flatnonzero(aleatorio.random(total) < 0.005):
+                fechas[i] = 'Sin fecha'
+
+            posicion = 0
+            for n, cantidad in enumerate(bloque):
+                noticia = {
+                    'titulo_noticia': f'Noticia sintética {primera + n}',
+                    'categoria': CATEGORIAS[aleatorio.integers(len(CATEGORIAS))],
+                    'comentarios': [
+                        {'autor': f'usuario{autores[i]}', 'fecha': fechas[i], 'contenido': textos[i]}
+                        for i in range(posicion, posicion + cantidad)
+                    ]
+                }
+                posicion += cantidad
+                if primera or n:
+                    archivo.write(',')
+                archivo.write(json.dumps(noticia, ensure_ascii=False))
+        archivo.write(']}}')
+    return ruta
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Genera una exportación sintética con el esquema de Cubadebate.")
+    parser.add_argument('comentarios', type=int, help="Número de comentarios a generar")
+    parser.add_argument('--salida', default='comentarios_sinteticos.json')
+    parser.add_argument('--semilla', type=int, default=0)
+    args = parser.parse_args(argumentos)
+    generar_exportacion(args.salida, args.comentarios, args.semilla)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,64 +2,69 @@ import json
 import streamlit as st
 import plotly.express as px
 import Story_Biblio as sb 
+import Cache_Biblio as cache
+import Indice_Biblio as ix
+import Picos_Biblio as pk
+import Metricas_Biblio as mt
 import pandas as pd
-from datetime import datetime
 
 def cargar_datos(ruta_archivo):
     try:
-        with open(ruta_archivo, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        
-        if "analisis_comentarios" not in data or "comentarios" not in data["analisis_comentarios"]:
-            st.error("Estructura del JSON inválida")
-            return pd.DataFrame()
-        
-        noticias = data["analisis_comentarios"]["comentarios"]
-        datos = []
-        
-        for noticia in noticias:
-            if "comentarios" not in noticia:
-                continue
-                
-            if noticia.get("categoria", "").lower() == "politica":
-                for comentario in noticia.get("comentarios", []):
-                    contenido = comentario.get("contenido")
-                    if contenido is None or not isinstance(contenido, str): 
-                        contenido = ""  
-                    
-                    fecha_str = comentario.get("fecha", "")
-                    if not fecha_str:
-                        continue
-                    
-                    try:
-                        fecha = datetime.strptime(fecha_str, "%Y-%m-%d")
-                    except ValueError:
-                        continue
-                    
-                    datos.append({
-                        "titulo_noticia": noticia.get("titulo_noticia", "Sin título"),
-                        "fecha_comentario": fecha,
-                        "contenido_comentario": contenido,  
-                        "usuario": comentario.get("autor", "Anónimo")
-                    })
-        
-        df = pd.DataFrame(datos)
-        
-        if not df.empty:
-            df = df.sort_values('fecha_comentario')
-            
-        return df
+        return cache.cargar_tabla(ruta_archivo, **sb.OPCIONES_HISTORIA)
     
+    except KeyError:
+        st.error("Estructura del JSON inválida")
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Error al cargar datos: {str(e)}")
         return pd.DataFrame()
 
-def mostrar_storytelling(df):
-    df['narrativa'] = df['contenido_comentario'].apply(sb.clasificar_narrativa)
-    df['emocion'], _ = zip(*df['contenido_comentario'].apply(sb.analizar_emociones))
-    consignas_df, resumen_consignas = sb.analizar_consignas_cubanas(df)
-    noticias_destacadas = sb.noticias_mas_comentadas(df, top_n=5)
-    actividad_temporal = sb.analisis_temporal(df)
+def cargar_indice(ruta_archivo, df):
+    # Sin combinar: al añadir anexos esta tabla se reordena por fecha y cambian las filas.
+    return cache.cargar_artefacto(
+        'indice_texto', lambda: ix.construir_indice(df), ix.leer_indice, ix.guardar_indice,
+        ruta_archivo, **sb.OPCIONES_HISTORIA
+    )
+
+def cargar_picos(ruta_archivo, df):
+    # El detector no depende del orden de las filas, así que los anexos solo puntúan sus días.
+    return cache.cargar_artefacto(
+        'picos', lambda: pk.construir_detector(df), pk.leer_detector, pk.guardar_detector,
+        ruta_archivo, combinar=pk.combinar, **sb.OPCIONES_HISTORIA
+    )
+
+def cargar_resumen(ruta_archivo):
+    # Con la tabla en caché al día, el resumen se lee sin cargar los comentarios.
+    datos = {}
+    def tabla():
+        if 'df' not in datos:
+            datos['df'] = cargar_datos(ruta_archivo)
+        return datos['df']
+
+    def construir():
+        df = tabla()
+        if df.empty:
+            return sb.resumen_historia(df)
+        return sb.resumen_historia(df, cargar_indice(ruta_archivo, df), cargar_picos(ruta_archivo, df))
+
+    if not cache.tabla_vigente(ruta_archivo, **sb.OPCIONES_HISTORIA) and tabla().empty:
+        return {'comentarios': 0}
+    return cache.cargar_artefacto('historia', construir, sb.leer_historia, sb.guardar_historia,
+                                  ruta_archivo, lexicos=sb.LEXICOS_HISTORIA, **sb.OPCIONES_HISTORIA)
+
+def _usos(consignas, frase):
+    frecuencia = consignas.loc[consignas['Consigna'] == frase, 'Frecuencia'].sum()
+    return f"({frecuencia} usos)" if frecuencia else "Ausencia total en los datos analizados"
+
+def mostrar_storytelling(resumen):
+    narrativas = resumen['narrativas'].set_index('narrativa')['porcentaje']
+    consignas_df = resumen['consignas']
+    noticias_destacadas = resumen['noticias']
+    record = resumen['record']
+    picos_detectados = resumen['picos']
+    pro = consignas_df[consignas_df['Afinidad'] == 'PRO'].sort_values('Frecuencia', ascending=False)
+    anti = consignas_df[consignas_df['Afinidad'] == 'ANTI'].sort_values('Frecuencia', kind='stable')
+    total_pro, total_anti = pro['Frecuencia'].sum(), anti['Frecuencia'].sum()
     
     st.markdown(f"""
     ## Dos años en los comentarios polìticos de Cubadebate
@@ -72,62 +77,82 @@ def mostrar_storytelling(df):
     el sitio Cubadebate sigue siendo uno de los principales nodos de participación digital en el país_
     _"A través de sus secciones de comentarios, miles de usuarios interactúan, opinan, confrontan y canalizan emociones frente a los temas de la agenda pública nacional."_
 
-    Este estudio analiza {len(df)} comentarios políticos entre {df['fecha_comentario'].dt.date.min()} y {df['fecha_comentario'].dt.date.max()}, 
+    Este estudio analiza {resumen['comentarios']} comentarios políticos entre {resumen['inicio']} y {resumen['fin']}, 
     como parte de una investigación universitaria sobre comunicación digital en Cuba.
 
     José Martínez, estudiante de cuarto año de Derecho en la Universidad de La Habana, llevaba tres años como presidente de la Federación Estudiantil Universitaria (FEU). 
     Su carisma y habilidad para mediar entre estudiantes y administración lo habían convertido en una figura respetada, pero él soñaba con  entrar en la política nacional.
 
     Una tarde, mientras revisaba las noticias en Cubadebate, notó algo peculiar: 
-    los comentarios de una publicacìon superaban los 500 en solo unas horas. "¿Què genera tanta pasión?", se preguntó. Decidió investigar.
+    los comentarios de una publicacìon llegaban a {resumen['maximo_noticia_dia']} en un solo día. "¿Què genera tanta pasión?", se preguntó. Decidió investigar.
 
 
     """)
+    if resumen['descartadas']:
+        st.caption(f"{resumen['descartadas']} comentarios políticos sin fecha válida no se incluyen en el estudio.")
 
-    st.plotly_chart(sb.picos_comentarios_por_fecha(df), use_container_width=True)
-    st.markdown("""
-    ### 29 de julio: El día que rompió récords
-    _"No podía creer lo que veía. 675 comentarios en un solo día , pero , que tema será el que provocó tanta controversia en esta página.  
+    fecha_record = pd.Timestamp(record['fecha'])
+    st.plotly_chart(sb.plot_actividad(resumen['actividad']), use_container_width=True)
+    st.markdown(f"""
+    ### {sb.fecha_texto(fecha_record)}: El día que rompió récords
+    _"No podía creer lo que veía. {record['conteo']} comentarios en un solo día , pero , que tema será el que provocó tanta controversia en esta página.  
     ¿Será que el tema toca fibra sensibles de nuestra realidad cotidiana?"_
 
-    **Dato clave**: El pico histórico del 29/07 superó en 3 veces el promedio diario
+    **Dato clave**: El pico histórico del {fecha_record:%d/%m} superó en {record['veces_promedio']} veces el promedio diario
     -
     """)
+    if record['titulo_noticia']:
+        st.markdown(f"""
+        La noticia que más comentarios aportó ese día fue *{record['titulo_noticia']}*, 
+        con el {record['proporcion']:.0%} de la conversación.
+        """)
 
-    st.markdown("""
+    if not picos_detectados.empty:
+        st.markdown(f"""
+        **Picos detectados**: {len(picos_detectados)} días en los que la participación se disparó respecto a las semanas anteriores.
+        """)
+        st.dataframe(picos_detectados.rename(columns={
+            'fecha': 'Fecha', 'conteo': 'Comentarios', 'esperado': 'Esperados', 'puntuacion': 'Puntuación',
+            'titulo_noticia': 'Noticia principal'
+        }), hide_index=True, use_container_width=True)
+
+    st.markdown(f"""
     ---
 
     ### Neutralidad aparente
-    Al analizar los comentarios, José notó que el 88% eran neutrales: frases como "ponle corazòn" o "unidad del pueblo" dominaban el espacio. Pero en lugar de ver apatía, 
+    Al analizar los comentarios, José notó que el {narrativas['NEUTRO']:.0f}% eran neutrales: frases como "ponle corazòn" o "unidad del pueblo" dominaban el espacio. Pero en lugar de ver apatía, 
     él detectó miedo. "La gente no es indiferente -explicaba en una reunión de la FEU-, solo que no saben desde que perspectiva hablar"
     
     _"La clasificación de los comentarios políticos se pueden identificar en tres categorías principales (progobierno, críticos o neutros)"_
     """)
     
-    fig_narrativa = px.pie(df, names='narrativa', title='Distribución de narrativas',
-                          color_discrete_map={'NEUTRO':'gray', 'PRO':'blue', 'ANTI':'red'})
+    fig_narrativa = px.pie(resumen['narrativas'], names='narrativa', values='conteo', title='Distribución de narrativas',
+                          color='narrativa', color_discrete_map={'NEUTRO':'gray', 'PRO':'blue', 'ANTI':'red'})
     st.plotly_chart(fig_narrativa, use_container_width=True)
     
-    conteo_narrativas = df['narrativa'].value_counts().to_dict()
     st.markdown(f"""
     **Desglose académico**:
-    - Neutrales: 88.5%  
+    - Neutrales: {narrativas['NEUTRO']}%  
     _(Ejemplo típico: "Interesante artículo, habrá que esperar los resultados")_
-    - PRO: 9.27%  
+    - PRO: {narrativas['PRO']}%  
     _(Ejemplo: "Esto demuestra los avances de nuestra Revolución")_
-    - ANTI: 2.25%  
+    - ANTI: {narrativas['ANTI']}%  
     _(Ejemplo: "Ojalá se cumpla lo prometido esta vez")_
 
     """)
 
-    st.markdown("""
+    if total_pro >= total_anti:
+        hallazgo = f"predominan {total_pro / total_anti:.3g}:1 sobre" if total_anti else "aparecen sin"
+    else:
+        hallazgo = f"quedan {total_anti / total_pro:.3g}:1 por detrás de" if total_pro else "no aparecen frente a"
+    st.markdown(f"""
     ---
 
     ### Consignas vs. conversación
-    "Hoy encontré algo curioso: 'Patria o Muerte' aparece 131 veces, 
-    pero frases como 'No más apagones' ninguna. ¿Dónde quedaron las que vemos en Facebook?"
+    "Hoy encontré algo curioso: '{pro.iloc[0]['Consigna']}' aparece {pro.iloc[0]['Frecuencia']} veces, 
+    pero frases como '{anti.iloc[0]['Consigna']}' {f"solo {anti.iloc[0]['Frecuencia']}" if anti.iloc[0]['Frecuencia'] else 'ninguna'}. ¿Dónde quedaron las que vemos en Facebook?"
 
-    **Hallazgo documentado**: Las consignas tradicionales predominan 34:1 sobre las críticas
+    **Hallazgo documentado**: Las consignas tradicionales {hallazgo} las críticas
     """)
   
     top_consignas = consignas_df[consignas_df['Frecuencia']>0].sort_values('Frecuencia', ascending=False)
@@ -138,14 +163,13 @@ def mostrar_storytelling(df):
                           title='Consignas detectadas (frecuencia > 0)')
     st.plotly_chart(fig_consignas, use_container_width=True)
     
-    st.markdown("""
+    st.markdown(f"""
     **Análisis comparativo**:
-    - "Cuba Libre" (69 usos):  
+    - "Cuba Libre" {_usos(consignas_df, 'Cuba libre')}:  
     _Aparece tanto en contextos patrióticos como críticos_
-    - "No tenemos miedo" (2 usos):  
+    - "No tenemos miedo" {_usos(consignas_df, 'No tenemos miedo')}:  
     _Mínima presencia vs. su circulación en otras plataformas_
-    - "Abajo la dictadura":  
-    _Ausencia total en los datos analizados_
+    - "Abajo la dictadura" {_usos(consignas_df, 'Abajo la dictadura')}  
 
     _"Entonces esto refleja moderación de contenido, autocensura o diferencias demográficas entre plataformas'._
     _ Uno de los aspectos más novedosos de la investigación es el análisis léxico y discursivo de las consignas y frases que se repiten en los comentarios. _
@@ -161,8 +185,6 @@ def mostrar_storytelling(df):
     _"Al analizar los artículos más comentados, emerge un patrón claro: los temas migratorios dominan la conversación"_
     """)
 
-    noticias_destacadas = sb.noticias_mas_comentadas(df, top_n=5)
-
     if not noticias_destacadas.empty:
         st.dataframe(noticias_destacadas.style.highlight_max(axis=0), use_container_width=True)
         st.markdown(f"""
@@ -201,24 +223,38 @@ def mostrar_storytelling(df):
     """)
 
 st.set_page_config(page_title="Cubadebate Analytics", page_icon="📊", layout="wide")
+mt.reiniciar()
 
 with st.sidebar:
     st.title("Configuración")
     archivo = st.file_uploader("Subir archivo JSON", type=["json"])
+    incremental = st.checkbox("Añadir solo los comentarios nuevos a los datos existentes", False)
+    mostrar_tiempos = st.checkbox("Mostrar tiempos de ejecución (depuración)", False)
     if archivo:
         try:
             datos = json.load(archivo)
-            with open("comentarios_cubadebate.json", "w", encoding="utf-8") as f:
-                json.dump(datos, f)
-            st.success("Archivo cargado correctamente")
+            if incremental:
+                if cache.registrar_anexo(archivo.getvalue(), "comentarios_cubadebate.json"):
+                    st.success("Comentarios nuevos añadidos a los datos existentes")
+            else:
+                with open("comentarios_cubadebate.json", "w", encoding="utf-8") as f:
+                    json.dump(datos, f)
+                cache.descartar_anexos("comentarios_cubadebate.json")
+                st.success("Archivo cargado correctamente")
         except Exception as e:
             st.error(f"Error al procesar archivo: {str(e)}")
 
 try:
-    df = cargar_datos("comentarios_cubadebate.json")
-    if df.empty:
+    resumen = cargar_resumen("comentarios_cubadebate.json")
+    if not resumen['comentarios']:
         st.warning("No se encontraron datos para analizar. Por favor sube un archivo válido.")
     else:
-        mostrar_storytelling(df)
+        mostrar_storytelling(resumen)
 except Exception as e:
-    st.error(f"Error en la aplicación: {str(e)}")
\ No newline at end of file
+    st.error(f"Error en la aplicación: {str(e)}")
+
+mt.exportar(aplicacion='Story')
+if mostrar_tiempos:
+    with st.sidebar.expander("⏱️ Tiempos de esta ejecución", expanded=True):
+        st.caption(f"Total medido: {mt.total():.2f} s")
+        st.dataframe(mt.tabla(sangrada=True), hide_index=True, use_container_width=True)
@@ -1,38 +1,61 @@
+import json
+import os
+from io import StringIO
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import Lexico_Biblio as lx
+import Indice_Biblio as ix
+import Picos_Biblio as pk
+import Graficos_Biblio as gr
+import Metricas_Biblio as mt
+
+OPCIONES_HISTORIA = {"categorias": ["politica"], "formato_fecha": "%Y-%m-%d", "descartar_sin_fecha": True}
+ORDEN_NARRATIVAS = ["NEUTRO", "PRO", "ANTI"]
+TOP_NOTICIAS = 5
+# Léxicos de los que depende el resumen de la historia, que se guarda con sus versiones.
+LEXICOS_HISTORIA = lx.NARRATIVA + ('consignas_pro', 'consignas_anti')
+MESES = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto", "septiembre", "octubre",
+         "noviembre", "diciembre"]
+
+def _narrativas(conteos):
+    contador_pro = lx.sumar(conteos, 'narrativa_pro')
+    contador_anti = lx.sumar(conteos, 'narrativa_anti')
+    etiquetas = np.select([contador_pro > contador_anti, contador_anti > contador_pro], ["PRO", "ANTI"], "NEUTRO")
+    return pd.Series(etiquetas, index=conteos.index)
+
+@mt.instrumentar
+def clasificar_narrativas(textos):
+    return _narrativas(lx.contar(textos, *lx.NARRATIVA))
 
 def clasificar_narrativa(texto):
-    palabras_pro = ["bloqueo", "revolución", "patria", "díaz-canel", "imperialismo"]
-    palabras_anti = ["corrupción", "ineficiencia", "protesta", "crisis"]
-    contador_pro = sum(texto.lower().count(palabra) for palabra in palabras_pro)
-    contador_anti = sum(texto.lower().count(palabra) for palabra in palabras_anti)
-    return "PRO" if contador_pro > contador_anti else "ANTI" if contador_anti > contador_pro else "NEUTRO"
+    # Un texto suelto se busca directamente: no vale la pena pasar por los conteos guardados.
+    return _narrativas(lx.escanear(pd.Series([texto]), *lx.NARRATIVA)).iloc[0]
 
-def picos_comentarios_por_fecha(df):
-    if df.empty: return px.line()
-    df_fechas = df[df['fecha_comentario'].notna()].copy()
-    df_fechas['fecha'] = df_fechas['fecha_comentario'].dt.date
-    conteo = df_fechas.groupby('fecha').size().reset_index(name='count')
-    conteo = conteo[conteo['count'] > 0].sort_values('fecha')
+def plot_actividad(actividad):
+    conteo = actividad.rename(columns={'conteo': 'count'})
+    conteo = gr.reducir(conteo[conteo['count'] > 0].sort_values('fecha'), ['count'], 'fecha')
     fig = px.line(conteo, x='fecha', y='count', title='Tendencia de Comentarios')
     fig.update_xaxes(rangeslider_visible=True)
     return fig
 
+@mt.instrumentar
+def picos_comentarios_por_fecha(df):
+    if df.empty: return px.line()
+    fechas = df['fecha_comentario'].dropna().dt.normalize().rename('fecha')
+    return plot_actividad(fechas.groupby(fechas).size().reset_index(name='conteo'))
+
+@mt.instrumentar
 def noticias_mas_comentadas(df, top_n=5):
     if df.empty: return pd.DataFrame()
-    df_agrupado = df.groupby('titulo_noticia').size().reset_index(name='total_comentarios')
+    df_agrupado = df.groupby('titulo_noticia', observed=True).size().reset_index(name='total_comentarios')
     return df_agrupado.sort_values('total_comentarios', ascending=False).head(top_n)
 
-def analizar_consignas_cubanas(df):
+@mt.instrumentar
+def analizar_consignas_cubanas(df, indice=None):
     consignas = {
-        "PRO": [
-            "Patria o Muerte", "Viva la Revolución", "Socialismo o Muerte",
-            "Cuba sí, bloqueo no", "Yo soy Fidel"
-        ],
-        "ANTI": [
-            "Abajo la dictadura", "No tenemos miedo", "Libertad para los presos políticos",
-            "Cuba libre", "No más represión", "no mas apagones"
-        ]
+        "PRO": lx.LEXICOS['consignas_pro'],
+        "ANTI": lx.LEXICOS['consignas_anti']
     }
 
     resultados = {
@@ -42,10 +65,16 @@ def analizar_consignas_cubanas(df):
         "Porcentaje": []
     }
 
+    if indice is None:
+        presencia = lx.contar(df['contenido_comentario'], 'consignas_pro', 'consignas_anti') > 0
     total_comentarios = len(df)
     for afinidad, frases in consignas.items():
         for frase in frases:
-            count = df['contenido_comentario'].str.contains(frase, case=False, regex=False).sum()
+            if indice is None:
+                count = presencia[lx.normalizar(frase)].sum()
+            else:
+                filas = ix.buscar(indice, frase)
+                count = len(filas) if len(df) == len(indice['dias']) else np.isin(filas, df.index).sum()
             porcentaje = (count / total_comentarios) * 100 if total_comentarios > 0 else 0
 
             resultados["Consigna"].append(frase)
@@ -64,15 +93,84 @@ def analizar_consignas_cubanas(df):
 
     return df_resultados.sort_values("Frecuencia", ascending=False), resumen
 
+def _emociones(conteos):
+    score = lx.sumar(conteos, 'emociones_positivas') - lx.sumar(conteos, 'emociones_negativas')
+    return pd.Series(np.select([score > 0, score < 0], ["positivo", "negativo"], "neutral"), index=conteos.index)
+
+@mt.instrumentar
+def analizar_emociones_textos(textos):
+    return _emociones(lx.contar(textos, *lx.EMOCION))
+
 def analizar_emociones(texto):
-    positivas = ["apoyo", "excelente", "gracias", "fuerte", "vencer"]
-    negativas = ["corrupción", "protesta", "crisis", "bloqueo", "injusto"]
-    score = sum(texto.lower().count(p) for p in positivas) - sum(texto.lower().count(n) for n in negativas)
-    return ("positivo", 1) if score > 0 else ("negativo", 1) if score < 0 else ("neutral", 0)
-
-def analisis_temporal(df):
-    df['fecha'] = df['fecha_comentario'].dt.date
-    actividad = df.groupby('fecha').size().reset_index(name='conteo')
-    q75 = actividad['conteo'].quantile(0.75)
-    actividad['pico'] = actividad['conteo'] > q75 * 1.5
-    return actividad
\ No newline at end of file
+    emocion = _emociones(lx.escanear(pd.Series([texto]), *lx.EMOCION)).iloc[0]
+    return (emocion, 0) if emocion == "neutral" else (emocion, 1)
+
+@mt.instrumentar
+def analisis_temporal(df, detector=None):
+    # Actividad diaria con los picos del detector en línea (Picos_Biblio) en lugar de un umbral global.
+    detector = detector if detector is not None else pk.construir_detector(df)
+    return pk.actividad(detector)
+
+def fecha_texto(fecha):
+    return f"{fecha.day} de {MESES[fecha.month - 1]}"
+
+def _valor(valor):
+    # Escalares de numpy/pandas a tipos de JSON.
+    if isinstance(valor, pd.Timestamp):
+        return valor.date().isoformat()
+    return valor.item() if isinstance(valor, np.generic) else valor
+
+@mt.instrumentar
+def resumen_historia(df, indice=None, detector=None):
+    # Todas las cifras que cita la historia, calculadas una vez por versión de los datos.
+    if df.empty:
+        return {'comentarios': 0}
+    detector = detector if detector is not None else pk.construir_detector(df)
+    consignas, resumen_consignas = analizar_consignas_cubanas(df, indice)
+    actividad = analisis_temporal(df, detector)
+
+    narrativas = df['narrativa'].value_counts().reindex(ORDEN_NARRATIVAS, fill_value=0)
+    narrativas = pd.DataFrame({'narrativa': narrativas.index, 'conteo': narrativas.to_numpy()})
+    narrativas['porcentaje'] = (100 * narrativas['conteo'] / len(df)).round(2)
+
+    record = actividad.loc[actividad['conteo'].idxmax()]
+    noticia_record = pk.noticias_pico(detector, [record['fecha']], top_n=1)
+    picos = pk.picos(detector)
+    principales = pk.noticias_pico(detector, picos['fecha'], top_n=1)
+    picos = picos.merge(principales[['fecha', 'titulo_noticia']], on='fecha', how='left')
+    noticias = noticias_mas_comentadas(df, top_n=TOP_NOTICIAS)
+
+    return {
+        'comentarios': len(df),
+        'inicio': _valor(df['fecha_comentario'].min()),
+        'fin': _valor(df['fecha_comentario'].max()),
+        'descartadas': (df.attrs.get('fechas') or {}).get('descartadas', 0),
+        'narrativas': narrativas,
+        'consignas': consignas,
+        'resumen_consignas': {k: _valor(v) for k, v in resumen_consignas.items()},
+        'noticias': noticias.assign(titulo_noticia=noticias['titulo_noticia'].astype(str)),
+        'actividad': actividad,
+        'picos': picos,
+        'record': {
+            'fecha': _valor(record['fecha']),
+            'conteo': _valor(record['conteo']),
+            'veces_promedio': round(float(record['conteo'] / actividad['conteo'].mean()), 1),
+            'titulo_noticia': noticia_record['titulo_noticia'].iloc[0] if len(noticia_record) else None,
+            'proporcion': _valor(noticia_record['proporcion'].iloc[0]) if len(noticia_record) else None,
+        },
+        'maximo_noticia_dia': _valor(detector['noticias']['comentarios'].max()),
+    }
+
+def guardar_historia(resumen, destino):
+    # Las tablas se guardan con orient='table' para recuperar sus tipos (fechas incluidas).
+    datos = {clave: {'tabla': json.loads(valor.to_json(orient='table', index=False))}
+             if isinstance(valor, pd.DataFrame) else valor for clave, valor in resumen.items()}
+    with open(destino + '.historia.json.tmp', 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo, ensure_ascii=False)
+    os.replace(destino + '.historia.json.tmp', destino + '.historia.json')
+
+def leer_historia(destino):
+    with open(destino + '.historia.json', 'r', encoding='utf-8') as archivo:
+        datos = json.load(archivo)
+    return {clave: pd.read_json(StringIO(json.dumps(valor['tabla'])), orient='table')
+            if isinstance(valor, dict) and 'tabla' in valor else valor for clave, valor in datos.items()}
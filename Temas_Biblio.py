@@ -0,0 +1,162 @@
+import os
+import numpy as np
+import pandas as pd
+import Frecuencias_Biblio as fr
+import Metricas_Biblio as mt
+
+# "kmeans" (MiniBatchKMeans sobre TF-IDF), "nmf" (MiniBatchNMF sobre TF-IDF) o "lda" (LDA en línea
+# sobre conteos). Requieren scikit-learn, que es opcional.
+METODO = os.environ.get('ECOCUBANO_TEMAS', 'kmeans')
+TEMAS = int(os.environ.get('ECOCUBANO_NUMERO_TEMAS') or 20)
+CARACTERISTICAS = 1 << 16
+TAMANO_LOTE = 20_000
+MUESTRA_PALABRAS = 2_000
+TERMINOS_POR_TEMA = 8
+SIN_TEMA = -1
+PALABRA = r"(?u)\b\w{4,}\b"
+
+
+def _vectorizador():
+    from sklearn.feature_extraction.text import HashingVectorizer
+    # Sin vocabulario: cada palabra cae en una de CARACTERISTICAS columnas, así la memoria no
+    # crece con el corpus y los lotes nuevos no cambian las columnas.
+    return HashingVectorizer(n_features=CARACTERISTICAS, token_pattern=PALABRA,
+                             stop_words=sorted(fr.PALABRAS_EXCLUIDAS), alternate_sign=False, norm=None)
+
+
+def _estimador(metodo, temas):
+    if metodo == 'kmeans':
+        from sklearn.cluster import MiniBatchKMeans
+        return MiniBatchKMeans(n_clusters=temas, random_state=0, n_init=3)
+    if metodo == 'nmf':
+        from sklearn.decomposition import MiniBatchNMF
+        return MiniBatchNMF(n_components=temas, random_state=0)
+    if metodo == 'lda':
+        from sklearn.decomposition import LatentDirichletAllocation
+        return LatentDirichletAllocation(n_components=temas, learning_method='online', random_state=0)
+    raise ValueError(f"Método de temas desconocido: {metodo!r} (se esperaba 'kmeans', 'nmf' o 'lda')")
+
+
+def modelo_vacio(metodo=None, temas=None):
+    metodo, temas = metodo or METODO, temas or TEMAS
+    return {
+        'metodo': metodo,
+        'temas': temas,
+        'estimador': _estimador(metodo, temas),
+        'ajustado': False,
+        'documentos': 0,
+        'frecuencias': np.zeros(CARACTERISTICAS, dtype=np.int64),
+        'palabras': {},
+    }
+
+
+def _conteos(textos):
+    return _vectorizador().transform(textos.fillna('').astype(str))
+
+
+def _ponderar(modelo, conteos):
+    # TF-IDF sublineal con las frecuencias de documento acumuladas y filas de norma 1.
+    from sklearn.preprocessing import normalize
+    if modelo['metodo'] == 'lda':
+        return conteos
+    ponderados = conteos.astype(np.float64)
+    idf = np.log((1 + modelo['documentos']) / (1 + modelo['frecuencias'])) + 1
+    ponderados.data = (1 + np.log(ponderados.data)) * idf[ponderados.indices]
+    return normalize(ponderados)
+
+
+def _nombrar(modelo, textos):
+    # El hashing no guarda qué palabra hay en cada columna: se anota con una muestra del lote.
+    from sklearn.feature_extraction.text import CountVectorizer
+    muestra = textos.iloc[:MUESTRA_PALABRAS].fillna('').astype(str)
+    try:
+        palabras = CountVectorizer(token_pattern=PALABRA, stop_words=sorted(fr.PALABRAS_EXCLUIDAS)).fit(muestra)
+    except ValueError:
+        return
+    palabras = palabras.get_feature_names_out()
+    columnas = _vectorizador().transform(palabras)
+    for palabra, columna in zip(palabras, columnas.indices[columnas.indptr[:-1]]):
+        modelo['palabras'].setdefault(int(columna), palabra)
+
+
+def _ajustar(modelo, textos):
+    conteos = _conteos(textos)
+    modelo['documentos'] += conteos.shape[0]
+    modelo['frecuencias'] += np.bincount(conteos.indices, minlength=CARACTERISTICAS)
+    _nombrar(modelo, textos)
+    con_palabras = np.diff(conteos.indptr) > 0
+    # MiniBatchKMeans necesita al menos tantos comentarios como temas en cada llamada.
+    if con_palabras.sum() >= modelo['temas']:
+        modelo['estimador'].partial_fit(_ponderar(modelo, conteos[con_palabras]))
+        modelo['ajustado'] = True
+
+
+def _asignar(modelo, textos):
+    conteos = _conteos(textos)
+    temas = np.full(conteos.shape[0], SIN_TEMA, dtype=np.int16)
+    con_palabras = np.flatnonzero(np.diff(conteos.indptr) > 0)
+    if not modelo['ajustado'] or not len(con_palabras):
+        return temas
+    datos = _ponderar(modelo, conteos[con_palabras])
+    if modelo['metodo'] == 'kmeans':
+        temas[con_palabras] = modelo['estimador'].predict(datos)
+    else:
+        temas[con_palabras] = modelo['estimador'].transform(datos).argmax(axis=1)
+    return temas
+
+
+def _lotes(textos, tamano_lote):
+    return [textos.iloc[inicio:inicio + tamano_lote] for inicio in range(0, len(textos), tamano_lote)]
+
+
+@mt.instrumentar
+def combinar(resultado, nuevos, tamano_lote=TAMANO_LOTE):
+    # El modelo sigue aprendiendo con los comentarios nuevos y solo a ellos se les asigna tema:
+    # los temas ya guardados no cambian.
+    modelo = resultado['modelo']
+    lotes = _lotes(nuevos['contenido_comentario'], tamano_lote)
+    for lote in lotes:
+        _ajustar(modelo, lote)
+    asignados = [_asignar(modelo, lote) for lote in lotes]
+    return {'modelo': modelo, 'temas': np.concatenate([resultado['temas']] + asignados)}
+
+
+def construir_temas(df, metodo=None, temas=None, tamano_lote=TAMANO_LOTE):
+    # Los temas son posiciones en la tabla de Cache_Biblio, igual que las filas del índice de texto.
+    vacio = {'modelo': modelo_vacio(metodo, temas), 'temas': np.zeros(0, dtype=np.int16)}
+    return combinar(vacio, df, tamano_lote)
+
+
+def describir(resultado, mascara=None, terminos=TERMINOS_POR_TEMA):
+    # Palabras de más peso y comentarios de cada tema, opcionalmente solo entre las filas de `mascara`.
+    modelo = resultado['modelo']
+    temas = resultado['temas'] if mascara is None else resultado['temas'][mascara]
+    comentarios = np.bincount(temas[temas != SIN_TEMA], minlength=modelo['temas'])
+    if not modelo['ajustado']:
+        pesos = np.zeros((modelo['temas'], CARACTERISTICAS))
+    elif modelo['metodo'] == 'kmeans':
+        pesos = modelo['estimador'].cluster_centers_
+    else:
+        pesos = modelo['estimador'].components_
+
+    descripciones = []
+    for fila in pesos:
+        columnas = [c for c in np.argsort(fila)[::-1] if fila[c] > 0 and int(c) in modelo['palabras']]
+        descripciones.append(', '.join(modelo['palabras'][int(c)] for c in columnas[:terminos]))
+    tabla = pd.DataFrame({'tema': np.arange(modelo['temas']), 'terminos': descripciones, 'comentarios': comentarios})
+    return tabla.sort_values('comentarios', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def guardar_temas(resultado, destino):
+    import joblib
+    joblib.dump(resultado['modelo'], destino + '.modelo.joblib')
+    np.save(destino + '.temas.npy', resultado['temas'])
+
+
+def leer_temas(destino, metodo=None, temas=None):
+    # Un modelo guardado con otro método o número de temas no sirve: el ValueError hace que se reconstruya.
+    import joblib
+    modelo = joblib.load(destino + '.modelo.joblib')
+    if (modelo['metodo'], modelo['temas']) != (metodo or METODO, temas or TEMAS):
+        raise ValueError(f"Temas guardados con otro modelo: {modelo['metodo']} ({modelo['temas']} temas)")
+    return {'modelo': modelo, 'temas': np.load(destino + '.temas.npy')}